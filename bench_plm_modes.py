@@ -0,0 +1,43 @@
+import sys
+import time
+import numpy as np
+from constants import WT, AATOIDX
+from plm_as_reward import PLMScorer
+
+# wild-type-marginal (forward 1回) と masked-marginal (forward L回) の一致度と速度を比較
+# usage: python bench_plm_modes.py [model_name]
+
+def spearman(a, b):
+    rank = lambda x: np.argsort(np.argsort(x))
+    return np.corrcoef(rank(a), rank(b))[0, 1]
+
+def compare(scorer, sequence):
+    tables, times = {}, {}
+    for mode in ("masked", "wt"):
+        start = time.perf_counter()
+        tables[mode] = scorer.score_table(sequence, mode=mode)
+        times[mode] = time.perf_counter() - start
+    # 野生型の列 (常に0) は除いて比較
+    wt = np.array([AATOIDX[aa] for aa in sequence])
+    keep = np.ones_like(tables["masked"], dtype=bool)
+    keep[np.arange(len(sequence)), wt] = False
+    masked, wt_marginal = tables["masked"][keep], tables["wt"][keep]
+    # 各位置の野生型以外で最もLLRが高い置換 (方策の提案) が一致する割合
+    top1 = {m: np.where(keep, tables[m], -np.inf).argmax(axis=1) for m in ("masked", "wt")}
+    return {
+        "length": len(sequence),
+        "spearman": spearman(masked, wt_marginal),
+        "pearson": np.corrcoef(masked, wt_marginal)[0, 1],
+        "top1_agreement": np.mean(top1["masked"] == top1["wt"]),
+        "masked_sec": times["masked"],
+        "wt_sec": times["wt"],
+        "speedup": times["masked"] / times["wt"],
+    }
+
+if __name__ == "__main__":
+    model_name = sys.argv[1] if len(sys.argv) > 1 else "facebook/esm2_t6_8M_UR50D"
+    # 速度比較のためキャッシュは使わない
+    scorer = PLMScorer(model_name, cache=None)
+    for protein in ("GFP", "AAV"):
+        result = compare(scorer, WT[protein])
+        print(protein, ", ".join(f"{k}: {v:.3f}" if isinstance(v, float) else f"{k}: {v}" for k, v in result.items()))
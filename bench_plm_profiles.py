@@ -0,0 +1,49 @@
+import sys
+import time
+import numpy as np
+import torch
+from constants import WT
+from plm import MaskedLM
+from plm_profile import InferenceProfile
+
+# CPU 推論プロファイルごとの速度と fp32 との argmax 一致率
+# usage: python bench_plm_profiles.py [model_name ...]
+MODELS = ["facebook/esm2_t6_8M_UR50D", "facebook/esm2_t12_35M_UR50D", "facebook/esm2_t30_150M_UR50D"]
+PROFILES = {
+    "fp32": None,
+    "int8": InferenceProfile(),
+    "bf16": InferenceProfile(quantize=False, bf16=True),
+    "int8+compile": InferenceProfile(compile=True),
+    "compile": InferenceProfile(quantize=False, compile=True),
+}
+
+def run(plm, sequence, positions, batch_size):
+    # 1バッチ目でウォームアップ (compile はここでコンパイルされる)
+    plm.masked_logits([sequence] * batch_size, positions[:batch_size], batch_size)
+    start = time.perf_counter()
+    logits = plm.masked_logits([sequence] * len(positions), positions, batch_size)
+    seconds = time.perf_counter() - start
+    n_batches = -(-len(positions) // batch_size)
+    return logits, {
+        "latency_ms": 1000 * seconds / n_batches,
+        "tokens_per_sec": len(positions) * (len(sequence) + 2) / seconds,
+    }
+
+if __name__ == "__main__":
+    sequence = WT["GFP"]
+    positions = list(np.random.default_rng(0).choice(len(sequence), 128, replace=False))
+    batch_size = 32
+    print(f"threads: {torch.get_num_threads()}, GFP length: {len(sequence)}, positions: {len(positions)}, batch: {batch_size}")
+    for model_name in sys.argv[1:] or MODELS:
+        reference = None
+        for name, profile in PROFILES.items():
+            try:
+                plm = MaskedLM(model_name, cache=None, profile=profile)
+                logits, result = run(plm, sequence, positions, batch_size)
+            except Exception as e:
+                print(f"{model_name} {name}: failed ({type(e).__name__}: {e})")
+                continue
+            if reference is None:
+                reference = logits.argmax(dim=-1)
+            result["argmax_agreement"] = (logits.argmax(dim=-1) == reference).float().mean().item()
+            print(f"{model_name} {name}: " + ", ".join(f"{k}: {v:.3f}" for k, v in result.items()))
@@ -0,0 +1,33 @@
+import sys
+import time
+import numpy as np
+from constants import WT, AATOIDX
+from plm_as_reward import PLMScorer
+from bench_plm_modes import spearman
+
+# 前後 k 残基の窓で masked-marginal を計算したときの速度と全長コンテキストとの一致度
+# usage: python bench_plm_window.py [model_name]
+WINDOWS = [8, 16, 32, 64]
+
+def score(scorer, sequence):
+    start = time.perf_counter()
+    table = scorer.score_table(sequence)
+    return table, time.perf_counter() - start
+
+if __name__ == "__main__":
+    model_name = sys.argv[1] if len(sys.argv) > 1 else "facebook/esm2_t6_8M_UR50D"
+    for protein in ("GFP", "AAV"):
+        sequence = WT[protein]
+        # 速度比較のためキャッシュは使わない
+        full, full_sec = score(PLMScorer(model_name, cache=None), sequence)
+        keep = np.ones_like(full, dtype=bool)
+        keep[np.arange(len(sequence)), [AATOIDX[aa] for aa in sequence]] = False
+        print(f"{protein} length: {len(sequence)}, full_sec: {full_sec:.3f}")
+        for k in WINDOWS:
+            if 2 * k + 1 >= len(sequence):
+                continue
+            table, sec = score(PLMScorer(model_name, cache=None, window=k), sequence)
+            top1 = [np.where(keep, t, -np.inf).argmax(axis=1) for t in (full, table)]
+            print(f"  window: {k}, sec: {sec:.3f}, speedup: {full_sec / sec:.3f}, "
+                  f"spearman: {spearman(full[keep], table[keep]):.3f}, "
+                  f"top1_agreement: {np.mean(top1[0] == top1[1]):.3f}")
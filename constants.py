@@ -2,6 +2,7 @@ import torch
 import numpy as np
 import torch.nn.functional as F
 import random 
+from oracle_lib.utils.codec import AAS, seqs_to_idx, idx_to_seqs, idx_to_one_hot, one_hot_to_idx
 
 # wild-type sequence
 WT = {
@@ -21,26 +22,22 @@ REFSEQ = {
     }
 }
 
-AAS = 'ARNDCQEGHILKMFPSTWYV'
-ALPHABET = list('ARNDCQEGHILKMFPSTWYV')
+ALPHABET = list(AAS)
 
 IDXTOAA = {i: ALPHABET[i] for i in range(20)}
 AATOIDX = {v: k for k, v in IDXTOAA.items()}
 
 def idx_to_seq(idx):
-    if isinstance(idx, np.ndarray):
-        idx = idx.tolist()      
-    return ''.join(IDXTOAA[i] for i in idx)
+    return idx_to_seqs(idx)[0]
 
 def seq_to_idx(seq):
-    return [AATOIDX[aa] for aa in list(seq)]
+    return seqs_to_idx(seq)[0].astype(np.int32)
 
 def seq_to_one_hot(seq):
-    return F.one_hot(torch.tensor([AATOIDX[aa] for aa in list(seq)]), 20)
+    return idx_to_one_hot(seqs_to_idx(seq)[0])
 
 def one_hot_to_seq(t):
-    idx = torch.argmax(t, dim=1).tolist()
-    return ''.join(IDXTOAA[i] for i in idx)
+    return idx_to_seqs(one_hot_to_idx(t))[0]
 
 def generate_random_mutant(sequence, mu) -> str:
     mutant = []
@@ -4,7 +4,8 @@ from callback import CustomTQDMCallback, WandbLoggingCallback
 from mut_env import MutationEnv
 from pos_env import PositionEnv
 from proxy import GFPScorer
-from oracle_lib.metric import Evaluator
+from oracle_lib.metric import Evaluator, StreamingEvaluator
+from oracle_lib.utils.registry import REGISTRY
 import warnings
 warnings.filterwarnings("ignore")
 import random
@@ -24,10 +25,7 @@ if __name__ == "__main__":
     
     length, min_fitness, max_fitness = get_fitness_info("GFP")
     evaluator = Evaluator(protein="GFP", max_target=max_fitness, min_target=min_fitness, device="cuda")
-    
-    sequences = []
-    sequences_aa = []
-    sequences_onehot = []
+    print(f"Model registry: {REGISTRY.stats()}")
     
     max_steps = 10_000_000
     log_interval = 100
@@ -37,6 +35,8 @@ if __name__ == "__main__":
     
     data = pd.read_csv(f'/home/ubuntu/workspace/plm-rl-protein-design/oracle_lib/data/GFP/hard.csv')[["sequence", "target"]]
     inits = data["sequence"].tolist()
+    # running metrics over every designed sequence, re-evaluating the full history is O(steps^2)
+    stream = StreamingEvaluator(evaluator, inits)
     for step in range(max_steps):
         with torch.no_grad():
             pos, _ = pos_policy.predict(gfp_seq, deterministic=True)
@@ -48,14 +48,14 @@ if __name__ == "__main__":
         pos = random.randint(0, len(gfp_seq)-1)
         mut = mut.item()
         gfp_seq[pos] = mut
-        sequences_aa.append(idx_to_seq(gfp_seq))
-        sequences_onehot.append(seq_to_one_hot(sequences_aa[-1]))
+        stream.update([idx_to_seq(gfp_seq)])
         if step % log_interval == 0:
             gfp_seq_aa = idx_to_seq(gfp_seq)
             print(f"Step={step} Pos={pos}, Mut={IDXTOAA[mut]} Reward={proxy([idx_to_seq(gfp_seq)])[0]:.3f}")
             # print(f"Step={step} Pos={pos}, Mut={IDXTOAA[mut]} Reward={proxy([idx_to_seq(gfp_seq)])[0]:.3f}, Obs={gfp_seq_aa}")
-            fitness, diversity, novelty, high = evaluator.evaluate(sequences_aa, inits)
-            print(f"Fitness={fitness:.3f}, Diversity={diversity:.3f}, Novelty={novelty:.3f}, High={high:.3f}")
+            summary = stream.summary()
+            print(f"Fitness={summary['fitness']:.3f}, Diversity={summary['diversity']:.3f} {summary['diversity_ci']}, Novelty={summary['novelty']:.3f}, High={summary['high']:.3f}")
+            print(f"Proxy cache: {proxy.cache.stats()}")
            
             
     
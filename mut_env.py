@@ -32,13 +32,14 @@ class MutationEnv(gym.Env):
         self.max_steps = max_steps
         self.steps = 0
         
-    def _calc_reward(self, sequence):
+    def _calc_reward(self, sequence, parent=None):
         """
         報酬の仮関数: 
+        parent: 変異前の配列 (差分スコアリング用)
         """
         if self.proxy is None:
             return 0.0
-        return self.proxy(sequence)[0]
+        return self.proxy(sequence, parent=parent)[0]
 
     def reset(self, seed=None, options=None):
         """
@@ -66,11 +67,12 @@ class MutationEnv(gym.Env):
         action = mut: 変異先のアミノ酸番号 (0 ~ 19)
         """        
         mut = action
+        parent = idx_to_seq(self.sequence)
          # 状態遷移におけるノイズのようなもので、ランダムに変異位置を選択
         self.sequence[self.pos] = mut  # 変異を適用
         self.steps += 1
   
-        reward = self._calc_reward([idx_to_seq(self.sequence)])
+        reward = self._calc_reward([idx_to_seq(self.sequence)], parent)
         # done = True # 1ステップで終了
         done = (self.steps >= self.max_steps)
         truncated = False
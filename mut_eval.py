@@ -1,7 +1,9 @@
 from constants import *
 from policy import MutationPolicy, PositionPolicy
 from plm_as_policy import PLMPolicy
+from plm_cache import CACHE
 from oracle_lib.metric import Evaluator
+from oracle_lib.utils.registry import REGISTRY
 from oracle_lib.config import get_fitness_info
 from mut_env import MutationEnv
 from proxy import GFPScorer
@@ -30,15 +32,28 @@ if __name__ == "__main__":
     mut_policy_fitness_list = []
     plm_policy_improved_count = 0
     mut_policy_improved_count = 0
+    plm_policy_best_count = 0
+    mut_policy_best_count = 0
     
     length, min_fitness, max_fitness = get_fitness_info("GFP")
     evaluator = Evaluator(protein="GFP", max_target=max_fitness, min_target=min_fitness, device="cuda")
+    print(f"Model registry: {REGISTRY.stats()}")
     
-    for i in tqdm(range(sample_num)):
+    samples = []
+    for i in range(sample_num):
         pos = random.randint(0, len(wt_seq_aa) - 1)
-        seq_aa = random_mutation(wt_seq_aa, mut_num)
+        samples.append((random_mutation(wt_seq_aa, mut_num), pos))
+    # PLMの提案はまとめてバッチで計算
+    plm_muts = plm_policy.get_muts([seq for seq, _ in samples], [pos for _, pos in samples])
+    print(f"PLM cache: {CACHE.stats()}")
+    
+    for i in tqdm(range(sample_num)):
+        seq_aa, pos = samples[i]
         orog_fitness = proxy([seq_aa])[0]
         original_fitness_list.append(orog_fitness)
+        # (L, 20) 全一点変異のfitness
+        fitness_map = proxy.scan(seq_aa)
+        best_aa = IDXTOAA[int(np.argmax(fitness_map[pos]))]
         seq_idx = seq_to_idx(seq_aa)
         # mut_policy
         mut, _ = mut_policy.predict({
@@ -46,27 +61,29 @@ if __name__ == "__main__":
             "position": pos,
         })
         mut_aa = IDXTOAA[mut.item()]
-        mut_seq_aa = seq_aa[:pos] + mut_aa + seq_aa[pos + 1:]
-        mut_fitness = proxy([mut_seq_aa])[0]
+        mut_fitness = fitness_map[pos, AATOIDX[mut_aa]]
         mut_policy_mut_aa_list.append(mut_aa)            
         mut_policy_fitness_list.append(mut_fitness)
         improved = mut_fitness > orog_fitness
         mut_policy_info = {"pos": pos, "mut": mut_aa, "fitness": mut_fitness, "improved": improved}
         mut_policy_improved_count += int(improved)
+        mut_policy_best_count += int(mut_aa == best_aa)
         
         # plm_policy
-        mut_aa = plm_policy.get_mut(seq_aa, pos)
-        mut_seq_aa = seq_aa[:pos] + mut_aa + seq_aa[pos + 1:]
-        plm_fitness = proxy([mut_seq_aa])[0]            
+        mut_aa = IDXTOAA[int(plm_muts[i])]
+        plm_fitness = fitness_map[pos, AATOIDX[mut_aa]]
         plm_policy_mut_aa_list.append(mut_aa)
         plm_policy_fitness_list.append(plm_fitness)
         improved = plm_fitness > orog_fitness
         plm_policy_info = {"pos": pos, "mut": mut_aa, "fitness": plm_fitness, "improved": improved}
         plm_policy_improved_count += int(improved)
+        plm_policy_best_count += int(mut_aa == best_aa)
         # print(f"{i=} {plm_policy_info=} {mut_policy_info=}")
       
             
     print(f"{plm_policy_improved_count=} {mut_policy_improved_count=}")
+    print(f"{plm_policy_best_count=} {mut_policy_best_count=}")
+    print(f"Proxy cache: {proxy.cache.stats()}")
     x_list = [i for i in range(sample_num)]
     plt.plot(x_list, plm_policy_fitness_list, label="PLM Policy")
     plt.plot(x_list, mut_policy_fitness_list, label="Mutation Policy")
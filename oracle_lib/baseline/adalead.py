@@ -126,11 +126,12 @@ class Adalead(Explorer):
                 for i in range(0, len(parents), self.eval_batch_size):
                     # Here we do rollouts from each parent (root of rollout tree)
                     roots = parents[i : i + self.eval_batch_size]
-                    root_fitnesses = self.model.get_fitness(roots)
+                    root_fitnesses = self.model.set_parents(list(roots))
                     self.model_calls += self.eval_batch_size
                     pbar.update(self.eval_batch_size)
                     
-                    nodes = list(enumerate(roots))
+                    # (root index, sequence, index of the sequence in the model's parent cache)
+                    nodes = [(idx, root, idx) for idx, root in enumerate(roots)]
 
                     while (
                         len(nodes) > 0
@@ -138,10 +139,11 @@ class Adalead(Explorer):
                         < self.model_calls_per_round
                     ):
                         child_idxs = []
+                        parent_ids = []
                         children = []
                         
                         while len(children) < len(nodes):
-                            idx, node = nodes[len(children) - 1]
+                            idx, node, parent_id = nodes[len(children) - 1]
 
                             child = generate_random_mutant(
                                 node,
@@ -155,21 +157,23 @@ class Adalead(Explorer):
                                 and child not in sequences
                             ):
                                 child_idxs.append(idx)
+                                parent_ids.append(parent_id)
                                 children.append(child)
 
                         # Stop the rollout once the child has worse predicted
                         # fitness than the root of the rollout tree.
                         # Otherwise, set node = child and add child to the list
                         # of sequences to propose.
-                        fitnesses = self.model.get_fitness(children)
+                        # Children replace their parents in the model's cache
+                        fitnesses = self.model.get_child_fitness(children, parent_ids, update=True)
                         self.model_calls += 1
                         pbar.update(1)
                         sequences.update(zip(children, fitnesses))
 
                         nodes = []
-                        for idx, child, fitness in zip(child_idxs, children, fitnesses):
+                        for parent_id, (idx, child, fitness) in enumerate(zip(child_idxs, children, fitnesses)):
                             if fitness >= root_fitnesses[idx]:
-                                nodes.append((idx, child))
+                                nodes.append((idx, child, parent_id))
 
         if len(sequences) == 0:
             raise ValueError(
@@ -3,7 +3,8 @@ import numpy as np
 from bisect import bisect_left
 import torch
 from utils.eval_utils import distance
-from utils.constants import AAS, generate_random_mutant, seq_to_one_hot, one_hot_to_seq
+from utils.constants import AAS, generate_random_mutant, seq_to_one_hot
+from utils.codec import idx_to_seqs, one_hot_to_idx
 from baseline.explorer import Explorer
 
 
@@ -101,8 +102,8 @@ class BayesianOptimization(Explorer):
             for action in actions[i]:
                 x[action] = 1
             actions_to_screen.append(x)
-            state_to_screen = self.construct_mutant_from_sample(x, state)
-            states_to_screen.append(one_hot_to_seq(torch.tensor(state_to_screen)))
+            states_to_screen.append(self.construct_mutant_from_sample(x, state))
+        states_to_screen = idx_to_seqs(one_hot_to_idx(np.stack(states_to_screen)))
         model_preds = self.model.get_fitness(states_to_screen)
         method_preds = (
             [self.EI(vals) for vals in model_preds]
@@ -3,7 +3,8 @@ import torch
 import cma
 import numpy as np
 from baseline.explorer import Explorer
-from utils.constants import AAS, seq_to_one_hot, one_hot_to_seq
+from utils.constants import AAS, seq_to_one_hot
+from utils.codec import idx_to_seqs
 
 class CMAES(Explorer):
     """
@@ -41,11 +42,7 @@ class CMAES(Explorer):
 
     def _soln_to_string(self, soln):
         x = soln.reshape((self.length, len(self.alphabet)))
-
-        one_hot = np.zeros(x.shape)
-        one_hot[np.arange(len(one_hot)), np.argmax(x, axis=1)] = 1
-
-        return one_hot_to_seq(torch.tensor(one_hot))
+        return idx_to_seqs(np.argmax(x, axis=1))[0]
 
     def propose_sequences(
         self
@@ -1,60 +1,102 @@
+import copy
 import numpy as np
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, TensorDataset
 from typing import List
 import torch.nn as nn
-import itertools
 from tqdm import tqdm
-from oracle_lib.net.rew import BaseCNN
+from oracle_lib.net.rew import BaseCNN, IncrementalScorer, StackedCNN, load_oracle, predict_fitness, scan_fitness
 from torch.optim import Adam
-from oracle_lib.utils.constants import seq_to_one_hot
-from oracle_lib.utils.eval_utils import distance 
+from oracle_lib.utils.codec import seqs_to_idx, idx_to_one_hot, as_idx
+from oracle_lib.utils.eval_utils import hist_median, pairwise_hamming_hist
+from oracle_lib.utils.hamming_index import cached_index
+from oracle_lib.utils.registry import REGISTRY
 
 class TrainDataset(Dataset):
     def __init__(self, data):
-        self.data = data
+        self.sequences = seqs_to_idx(data['sequence'].tolist())
+        self.targets = torch.tensor(data['true_score'].to_numpy())
     
     def __getitem__(self, idx):
-        return seq_to_one_hot(self.data.iloc[idx]['sequence']), torch.tensor(self.data.iloc[idx]['true_score'])
+        return idx_to_one_hot(self.sequences[idx]), self.targets[idx]
     
     def __len__(self):
-        return len(self.data)
+        return len(self.targets)
     
-class SequenceDataset(Dataset):
-    def __init__(self, sequences):
-        self.sequences = sequences
-    
-    def __getitem__(self, idx):
-        return seq_to_one_hot(self.sequences[idx])
-    
-    def __len__(self):
-        return len(self.sequences)
-    
-
 class Ensemble:
-    def __init__(self, N, epochs, device):
-        self.models = [
-            Model(epochs, device) for i in range(N)
-        ]
+    """N oracle models stacked into one StackedCNN, trained and scored in batched forwards."""
+    def __init__(self, N, epochs, device, batch_size=None):
+        self.model = StackedCNN(N).to(device)
+        self.N = N
+        self.epochs = epochs
+        self.device = device
+        self.batch_size = batch_size # None: sized automatically
         
-    def train(self, data, verbose=False):
-        for model in self.models:
-            model.train(data.sample(frac=.8), verbose)
+    def train(self, data, verbose=False, frac=.8):
+        dset = TrainDataset(data)
+        n = len(dset)
+        # each member fits its own random subset of round(frac * n) rows, like data.sample(frac=frac) per model
+        masks = torch.zeros(n, self.N)
+        masks.scatter_(0, torch.rand(n, self.N).argsort(dim=0)[:round(frac * n)], 1.0)
+        dloader = DataLoader(TensorDataset(torch.from_numpy(dset.sequences), dset.targets, masks), batch_size=128)
+        # Adam is elementwise, so one optimizer over the stacked parameters equals one optimizer per member
+        optimizer = Adam(self.model.parameters(), lr=1e-4)
+        self.model.train()
+        for epoch in tqdm(range(1, self.epochs + 1), desc='Training Ensemble'):
+            total_loss = torch.zeros(self.N)
+            for seqs, scores, mask in dloader:
+                optimizer.zero_grad()
+                seqs = seqs.to(self.device)
+                scores, mask = scores.float().to(self.device), mask.to(self.device)
+                preds = self.model(seqs)
+                # per-member mse over the rows in its subset
+                loss = ((preds - scores[:, None]) ** 2 * mask).sum(0) / mask.sum(0).clamp(min=1)
+                loss.sum().backward()
+                total_loss += loss.detach().cpu()
+                optimizer.step()
+        print(f'Ensemble mse {np.round((total_loss / len(dloader)).numpy(), 3).tolist()}')
         
     def get_fitness(self, sequences: List[str]):
-        ensembles = []
-        for model in self.models:
-            ensembles.append(model.get_fitness(sequences))
-        return np.stack(ensembles, axis=1)       
+        """(N_seqs, N) fitness of every member, accepts sequences or a pre-encoded index matrix."""
+        self.model.eval()
+        return predict_fitness(self.model, as_idx(sequences), self.batch_size)
     
 class Model:
-    def __init__(self, epochs, device):
+    def __init__(self, epochs, device, batch_size=None):
         model = BaseCNN(make_one_hot=False)
         self.model = model.to(device)
+        self.incremental = IncrementalScorer(self.model)
+        self.shared = False # self.model is the registry's read-only instance
         self.epochs = epochs 
         self.device = device
+        self.batch_size = batch_size # None: sized automatically
+
+    def load(self, path: str):
+        """
+        Load oracle weights from a training checkpoint or an exported TorchScript artifact (*.ts).
+        The weights are shared through the model registry and read-only, train copies them first.
+        """
+        if self.shared:
+            REGISTRY.release(self.model)
+        self.model = REGISTRY.acquire('BaseCNN', path, self.device, lambda: load_oracle(path, self.device))
+        self.shared = True
+        # exported artifacts have no per-layer access, they fall back to full forwards
+        self.incremental = IncrementalScorer(self.model) if IncrementalScorer.supports(self.model) else None
     
+    def unshare(self):
+        """Swap the registry's shared weights for a private trainable copy."""
+        if not self.shared:
+            return
+        if not any(True for _ in self.model.parameters()):
+            raise ValueError('exported oracle artifacts (*.ts) cannot be trained, load a training checkpoint')
+        shared = self.model
+        self.model = copy.deepcopy(shared).requires_grad_(True)
+        REGISTRY.release(shared)
+        self.shared = False
+        self.incremental = IncrementalScorer(self.model) if IncrementalScorer.supports(self.model) else None
+
     def train(self, data, verbose=False):
+        self.unshare()
         dset = TrainDataset(data)
         dloader = DataLoader(dset, batch_size=128)
         optimizer = Adam(self.model.parameters(), lr=1e-4)
@@ -73,29 +115,38 @@ class Model:
         print(f'Model mse {round(total_loss/len(dloader),3)}')
             
     def get_fitness(self, sequences: List[str]):
-        dset = SequenceDataset(sequences)
-        dloader = DataLoader(dset, batch_size=128)
-        scores = []
+        """Accepts sequences or a pre-encoded (N, L) index matrix."""
+        self.model.eval()
+        return predict_fitness(self.model, as_idx(sequences), self.batch_size)
+
+    def set_parents(self, parents: List[str]):
+        """Cache parents for get_child_fitness and return their fitness."""
+        self.model.eval()
+        if self.incremental is None:
+            return self.get_fitness(parents)
+        return self.incremental.set_parents(seqs_to_idx(parents)).cpu().numpy().astype(float)
+
+    def get_child_fitness(self, children: List[str], parent_ids=None, update=False):
+        """Score children of the cached parents by recomputing only the mutated windows."""
         self.model.eval()
-        for data in dloader:
-            data = data.to(self.device)
-            with torch.no_grad():
-                score = self.model(data).detach().cpu().numpy().astype(float).reshape(-1)
-            scores.append(score)
+        if self.incremental is None:
+            return self.get_fitness(children)
+        return self.incremental.score(seqs_to_idx(children), parent_ids, update).cpu().numpy().astype(float).reshape(-1)
 
-        return np.concatenate(scores)
+    def scan(self, sequence: str, chunk_size: int = 2048):
+        """(L, 20) fitness of every single-site substitution of `sequence`."""
+        self.model.eval()
+        if self.incremental is None:
+            return scan_fitness(self.model, seqs_to_idx(sequence)[0], chunk_size, self.batch_size)
+        return self.incremental.scan(seqs_to_idx(sequence)[0], chunk_size).cpu().numpy().astype(float)
     
 class InSilicoLandscape:
     def __init__(self, cfg):
         self.device = cfg.device
-        oracle = BaseCNN(make_one_hot=False)
-        oracle_ckpt = torch.load(cfg.rew_pretrained, map_location=self.device)
-        if "state_dict" in oracle_ckpt.keys():
-            oracle_ckpt = oracle_ckpt["state_dict"]
-        oracle.load_state_dict({ k.replace('predictor.',''):v for k,v in oracle_ckpt.items() })
-        oracle.eval()
         self.config = cfg
-        self.oracle = oracle.to(self.device)
+        # cfg.rew_pretrained may point to an exported artifact (*.ts)
+        self.oracle = REGISTRY.acquire('BaseCNN', cfg.rew_pretrained, self.device, lambda: load_oracle(cfg.rew_pretrained, self.device))
+        self.incremental = IncrementalScorer(self.oracle) if IncrementalScorer.supports(self.oracle) else None
         
     def evaluate(self, sequences, starting_sequences, topk):
         scores = self.get_fitness(sequences)
@@ -103,18 +154,9 @@ class InSilicoLandscape:
         sequences, targets = sequences[indices], scores[indices]
         fitness = np.median(targets)
         
-        distances = []
-        for s1, s2 in itertools.combinations(sequences, 2):
-            distances.append(distance(s1, s2))
-        diversity = np.median(distances)
-        
-        distances = []
-        for j in sequences:
-            dist_j = []
-            for i in starting_sequences:
-                dist_j.append(distance(i,j))
-            distances.append(min(dist_j))
-        novelty = np.median(distances)
+        idx = as_idx(sequences)
+        diversity = hist_median(pairwise_hamming_hist(idx))
+        novelty = np.median(cached_index(starting_sequences).query(idx))
 
         return scores, fitness, diversity, novelty
     
@@ -122,13 +164,14 @@ class InSilicoLandscape:
         return (target - self.config.min_fitness)/(self.config.max_fitness - self.config.min_fitness)
 
     def get_fitness(self, sequences: List[str]):
-        dset = SequenceDataset(sequences)
-        dloader = DataLoader(dset, batch_size=128)
-        scores = []
-        for data in dloader:
-            data = data.to(self.device)
-            with torch.no_grad():
-                score = self.oracle(data).detach().cpu().numpy().astype(float).reshape(-1)
-            scores.append(self.normalize_target(score))
+        """Accepts sequences or a pre-encoded (N, L) index matrix."""
+        scores = predict_fitness(self.oracle, as_idx(sequences), self.config.batch_size)
+        return self.normalize_target(scores)
 
-        return np.concatenate(scores)
+    def scan(self, sequence: str, chunk_size: int = 2048):
+        """(L, 20) normalized fitness of every single-site substitution of `sequence`."""
+        if self.incremental is None:
+            scores = scan_fitness(self.oracle, seqs_to_idx(sequence)[0], chunk_size, self.config.batch_size)
+        else:
+            scores = self.incremental.scan(seqs_to_idx(sequence)[0], chunk_size).cpu().numpy().astype(float)
+        return self.normalize_target(scores)
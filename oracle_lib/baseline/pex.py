@@ -62,17 +62,23 @@ class ProximalExploration(Explorer):
         # Construct the candiate pool by randomly mutating the sequences. (line 2 of Algorithm 2 in the paper)
         # An implementation heuristics: only mutating sequences near the proximal frontier.
         candidate_pool = []
+        candidate_parents = []
         while len(candidate_pool) < self.model_calls_per_round:
-            candidate_sequence = random_mutation(random.choice(frontier_neighbors)['sequence'], self.num_random_mutations)
+            parent_id = random.randrange(len(frontier_neighbors))
+            candidate_sequence = random_mutation(frontier_neighbors[parent_id]['sequence'], self.num_random_mutations)
             if candidate_sequence not in measured_sequence_set:
                 candidate_pool.append(candidate_sequence)
+                candidate_parents.append(parent_id)
                 measured_sequence_set.add(candidate_sequence)
         
+        # Candidates are scored incrementally from their frontier parent.
+        self.model.set_parents([data['sequence'] for data in frontier_neighbors])
+        
         # Arrange the candidate pool by the distance to the wild type.
         candidate_pool_dict = {}
         for i in range(0, len(candidate_pool), self.batch_size):
             candidate_batch =  candidate_pool[i:i+self.batch_size]
-            model_scores = self.model.get_fitness(candidate_batch)
+            model_scores = self.model.get_child_fitness(candidate_batch, candidate_parents[i:i+self.batch_size])
             for candidate, model_score in zip(candidate_batch, model_scores):
                 distance_to_wt = distance(candidate, self.wt_sequence)
                 if distance_to_wt not in candidate_pool_dict.keys():
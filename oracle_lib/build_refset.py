@@ -0,0 +1,24 @@
+'''
+Build the binary reference-set caches read by metric.Evaluator (see utils/refset.py).
+Evaluator rebuilds a stale cache on its own; run this once after updating the data to keep that off the start-up path.
+
+python build_refset.py --protein GFP AAV
+'''
+import argparse
+import time
+from utils.refset import build_refset
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--protein', type=str, nargs='+', choices=['GFP', 'AAV'], required=True)
+parser.add_argument('--csv', type=str, default='all', help='data/{protein}/{csv}.csv')
+args = parser.parse_args()
+
+
+def main():
+    for protein in args.protein:
+        start = time.time()
+        out_dir = build_refset(f'data/{protein}/{args.csv}.csv')
+        print(f'saved to {out_dir} in {time.time() - start:.2f}s')
+
+if __name__ == '__main__':
+    main()
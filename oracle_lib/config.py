@@ -1,6 +1,6 @@
 import argparse
 
-def config_rep(device, protein, level, reduce_dim=None):
+def config_rep(device, protein, level, reduce_dim=None, student_pretrained=None):
     assert protein in ['GFP', 'AAV']
     args = argparse.Namespace()
     args.name = protein
@@ -23,6 +23,9 @@ def config_rep(device, protein, level, reduce_dim=None):
         raise NotImplementedError()
     if reduce_dim != None:
         args.reduce_dim = reduce_dim
+    args.lean_load = False # True: mmap checkpoints, no random init, share identical encoder/lm modules (check with report_ved_memory.py first)
+    args.encoder_dtype = None # frozen encoder precision, None (float32) | 'bf16' | 'int8' (CPU only)
+    args.student_pretrained = student_pretrained # distilled encoder (distill_encoder.py), None: ESM-2 encoder
     return args
 
 def get_fitness_info(protein):
@@ -48,6 +51,7 @@ def create_base(args):
     opt.seq_pretrained =f'saved/{args.protein}_{args.level}_LM.pt'
     opt.rew_pretrained = f'ckpt/{opt.name}/oracle.ckpt' 
     opt.reduce_dim = None
+    opt.batch_size = None # oracle inference batch size, None: sized automatically
     return opt
 
 def create_opt(args):
@@ -69,8 +73,10 @@ def create_opt(args):
         opt.done_cond = argparse.Namespace(max_steps=3, max_mutation=15, step_mut=opt.step_mut)
     opt.seq_pretrained =f'saved/{args.protein}_{args.level}_LM.pt'
     opt.rew_pretrained = f'ckpt/{opt.name}/oracle.ckpt' if args.use_oracle else f'ckpt/{opt.name}/{args.level}.ckpt'
+    opt.oracle_server = getattr(args, 'oracle_server', None) # socket of serve_oracle.py, None: load the oracle in-process
+    opt.student_pretrained = getattr(args, 'student_pretrained', None) # saved/{protein}_{level}_student.pt, None: ESM-2 encoder
     opt.reduce_dim = None
     return opt
 
 def create_rep_from_opt(opt):
-    return config_rep(opt.device, opt.name, opt.level, opt.reduce_dim)
+    return config_rep(opt.device, opt.name, opt.level, opt.reduce_dim, getattr(opt, 'student_pretrained', None))
@@ -0,0 +1,146 @@
+'''
+Distil the VED latent encoder, reduce(CLS - CLS(WT)) of the 650M ESM-2, into a StudentCNN (net/student.py)
+for one (protein, level) and report its fidelity against the teacher on held-out sequences:
+latent MSE / R^2, and agreement of the sequences decoded from teacher and student latents.
+Training sequences are data/{protein}/{level}.csv plus random mutants of them, labelled once by the teacher.
+Set student_pretrained (config_rep / create_opt) to the saved checkpoint to have VED encode with the student.
+
+python distill_encoder.py --protein GFP --level hard --device cuda
+'''
+import argparse
+import json
+import random
+import time
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from config import config_rep
+from net.seq_lm import VED
+from net.student import StudentCNN, save_student
+from utils.codec import seqs_to_idx
+from utils.constants import REFSEQ, ALPHABET
+
+TOPK = {'GFP': 18, 'AAV': 8} # decoding top-k of create_opt
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--protein', type=str, choices=['GFP', 'AAV'], required=True)
+parser.add_argument('--level', type=str, choices=['hard', 'medium'], required=True)
+parser.add_argument('--device', type=str, choices=['cpu', 'cuda'], required=True)
+parser.add_argument('--n_mutants', type=int, default=20000, help='random mutants of the dataset sequences')
+parser.add_argument('--max_mutations', type=int, default=3)
+parser.add_argument('--hidden_size', type=int, default=256)
+parser.add_argument('--epochs', type=int, default=50)
+parser.add_argument('--batch_size', type=int, default=256)
+parser.add_argument('--lr', type=float, default=1e-3)
+parser.add_argument('--val_frac', type=float, default=0.1)
+parser.add_argument('--n_decode', type=int, default=512, help='held-out sequences used for decode agreement')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--out', type=str, default=None, help='defaults to saved/{protein}_{level}_student.pt')
+args = parser.parse_args()
+
+
+def mutants(seqs, n, rng):
+    out = []
+    for _ in range(n):
+        seq = list(rng.choice(seqs))
+        for pos in rng.sample(range(len(seq)), rng.randint(1, args.max_mutations)):
+            seq[pos] = rng.choice(ALPHABET)
+        out.append(''.join(seq))
+    return out
+
+
+def teacher_latents(teacher, seqs, chunk_size=1024):
+    latents = []
+    with torch.no_grad():
+        for start in range(0, len(seqs), chunk_size):
+            latents.append(teacher.encode_many(seqs[start:start + chunk_size]).cpu())
+    return torch.cat(latents)
+
+
+def train(student, x_train, y_train, x_val, y_val):
+    optimizer = torch.optim.Adam(student.parameters(), lr=args.lr)
+    best_loss, best_state = float('inf'), None
+    for epoch in range(args.epochs):
+        student.train()
+        perm = torch.randperm(len(x_train))
+        for start in range(0, len(perm), args.batch_size):
+            batch = perm[start:start + args.batch_size]
+            loss = F.mse_loss(student(x_train[batch].to(args.device)), y_train[batch].to(args.device))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        val_loss = F.mse_loss(predict(student, x_val), y_val).item()
+        if val_loss < best_loss:
+            best_loss, best_state = val_loss, {k: v.clone() for k, v in student.state_dict().items()}
+        print(f'epoch {epoch}: val mse {val_loss:.6f}')
+    student.load_state_dict(best_state)
+    student.eval()
+    return student
+
+
+def predict(student, x, chunk_size=4096):
+    student.eval()
+    with torch.no_grad():
+        return torch.cat([student(x[start:start + chunk_size].to(args.device)).cpu() for start in range(0, len(x), chunk_size)])
+
+
+def fidelity(teacher, student, seqs, x, y):
+    y_student = predict(student, x)
+    mse = F.mse_loss(y_student, y).item()
+    report = {
+        'n_val': len(seqs),
+        'latent_mse': mse,
+        'latent_r2': 1 - mse / y.var(dim=0, unbiased=False).mean().item(),
+        'latent_cosine': F.cosine_similarity(y_student, y, dim=-1).mean().item(),
+    }
+    # decode both latents with the env's constrained decoding, templated on the input sequence
+    n = min(args.n_decode, len(seqs))
+    with torch.no_grad():
+        decoded = [teacher.logits_to_idx(teacher.decode(z[:n].to(args.device)), seqs[:n], TOPK[args.protein]).cpu()
+                   for z in (y, y_student)]
+    report['decode_exact_agreement'] = (decoded[0] == decoded[1]).all(dim=1).float().mean().item()
+    report['decode_position_agreement'] = (decoded[0] == decoded[1]).float().mean().item()
+    # encoder cost per sequence, teacher without its cache
+    batch = seqs[:min(256, len(seqs))]
+    teacher.encode_cache.clear()
+    with torch.no_grad():
+        start = time.time()
+        teacher.encode_many(batch)
+        report['teacher_ms_per_seq'] = 1000 * (time.time() - start) / len(batch)
+        start = time.time()
+        predict(student, torch.as_tensor(seqs_to_idx(batch)))
+        report['student_ms_per_seq'] = 1000 * (time.time() - start) / len(batch)
+    return report
+
+
+def main():
+    rng = random.Random(args.seed)
+    torch.manual_seed(args.seed)
+    seq_cfg = config_rep(args.device, args.protein, args.level)
+    teacher = VED(seq_cfg, pretrained=f'saved/{args.protein}_{args.level}_LM.pt').to(args.device)
+    teacher.eval()
+    wt = REFSEQ[args.protein][args.level]
+    teacher.set_wt_tokens(wt)
+
+    data = pd.read_csv(f'data/{args.protein}/{args.level}.csv')['sequence'].drop_duplicates().tolist()
+    seqs = list(dict.fromkeys(data + mutants(data, args.n_mutants, rng)))
+    rng.shuffle(seqs)
+    print(f'labelling {len(seqs)} sequences with the teacher')
+    y = teacher_latents(teacher, seqs)
+    x = torch.as_tensor(seqs_to_idx(seqs))
+    n_val = max(1, int(len(seqs) * args.val_frac))
+
+    student = StudentCNN(seq_cfg.reduce_dim, hidden_size=args.hidden_size).to(args.device)
+    student = train(student, x[n_val:], y[n_val:], x[:n_val], y[:n_val])
+    report = fidelity(teacher, student, seqs[:n_val], x[:n_val], y[:n_val])
+
+    out = args.out or f'saved/{args.protein}_{args.level}_student.pt'
+    save_student(out, student, wt, reduce_dim=seq_cfg.reduce_dim, hidden_size=args.hidden_size)
+    with open(out.rsplit('.', 1)[0] + '.json', 'w') as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f'saved to {out}')
+
+if __name__ == '__main__':
+    main()
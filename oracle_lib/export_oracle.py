@@ -0,0 +1,107 @@
+'''
+Export ckpt/{protein}/oracle.ckpt to a frozen TorchScript artifact for CPU inference
+and report its drift against the float checkpoint.
+
+PYTHONPATH=.. python export_oracle.py --protein GFP [--quantize]
+'''
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from oracle_lib.net.rew import FusedCNN, load_oracle, predict_fitness
+from oracle_lib.utils.codec import seqs_to_idx
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--protein', type=str, choices=['GFP', 'AAV'], required=True)
+parser.add_argument('--ckpt', type=str, default=None, help='defaults to ckpt/{protein}/oracle.ckpt')
+parser.add_argument('--data', type=str, default=None, help='defaults to data/{protein}/all.csv')
+parser.add_argument('--out_dir', type=str, default=None, help='defaults to ckpt/{protein}')
+parser.add_argument('--quantize', action='store_true', help='also export a dynamic-int8 variant')
+parser.add_argument('--batch_size', type=int, default=1024)
+args = parser.parse_args()
+
+
+def export(model, path, quantize=False):
+    fused = FusedCNN(model).eval()
+    if quantize:
+        fused = torch.ao.quantization.quantize_dynamic(fused, {nn.Linear}, dtype=torch.qint8)
+    frozen = torch.jit.freeze(torch.jit.script(fused))
+    if not quantize:
+        frozen = torch.jit.optimize_for_inference(frozen)
+    frozen.save(path)
+
+
+def rank(x):
+    r = np.empty(len(x))
+    r[np.argsort(x)] = np.arange(len(x))
+    return r
+
+
+def compare(reference, preds, targets):
+    err = np.abs(preds - reference)
+    k = max(1, len(reference) // 10)
+    top_ref = set(np.argsort(reference)[-k:].tolist())
+    top_pred = set(np.argsort(preds)[-k:].tolist())
+    return {
+        'max_abs_err': float(err.max()),
+        'mean_abs_err': float(err.mean()),
+        'pearson': float(np.corrcoef(reference, preds)[0, 1]),
+        'spearman': float(np.corrcoef(rank(reference), rank(preds))[0, 1]),
+        'top_decile_overlap': len(top_ref & top_pred) / k,
+        'pearson_target': float(np.corrcoef(targets, preds)[0, 1]),
+    }
+
+
+def timed_predict(model, idx):
+    start = time.time()
+    preds = predict_fitness(model, idx, args.batch_size)
+    return preds, time.time() - start
+
+
+def main():
+    ckpt = args.ckpt or f'ckpt/{args.protein}/oracle.ckpt'
+    data_path = args.data or f'data/{args.protein}/all.csv'
+    out_dir = args.out_dir or f'ckpt/{args.protein}'
+    os.makedirs(out_dir, exist_ok=True)
+
+    data = pd.read_csv(data_path)[['sequence', 'target']]
+    idx = seqs_to_idx(data['sequence'].tolist())
+    targets = data['target'].to_numpy()
+
+    model = load_oracle(ckpt, 'cpu')
+    reference, seconds = timed_predict(model, idx)
+    report = {
+        'protein': args.protein,
+        'ckpt': ckpt,
+        'data': data_path,
+        'n_sequences': len(idx),
+        'threads': torch.get_num_threads(),
+        'variants': {
+            'float_ckpt': {'seconds': seconds, **compare(reference, reference, targets)},
+        },
+    }
+
+    variants = [('oracle', False)] + ([('oracle_int8', True)] if args.quantize else [])
+    for name, quantize in variants:
+        path = os.path.join(out_dir, f'{name}.ts')
+        export(model, path, quantize)
+        preds, seconds = timed_predict(load_oracle(path, 'cpu'), idx)
+        report['variants'][name] = {
+            'path': path,
+            'size_bytes': os.path.getsize(path),
+            'seconds': seconds,
+            **compare(reference, preds, targets),
+        }
+        print(f"{name}: saved to {path}, max abs err {report['variants'][name]['max_abs_err']:.2e}, {seconds:.2f}s")
+
+    report_path = os.path.join(out_dir, 'export_report.json')
+    with open(report_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"saved to {report_path}")
+
+if __name__ == '__main__':
+    main()
@@ -1,70 +1,162 @@
 import torch 
-from torch.utils.data import Dataset
-from torch.utils.data import DataLoader
 import numpy as np
-import itertools
-import pandas as pd
-from oracle_lib.net.rew import BaseCNN
-from oracle_lib.utils.eval_utils import distance
-from oracle_lib.utils.constants import seq_to_one_hot
+from oracle_lib.net.rew import load_oracle, predict_fitness
+from oracle_lib.utils.eval_utils import hist_median, hist_quantile, pairwise_hamming_hist
+from oracle_lib.utils.hamming_index import HammingIndex, cached_index
+from oracle_lib.utils.codec import as_idx, idx_to_seqs
+from oracle_lib.utils.refset import load_refset
+from oracle_lib.utils.registry import REGISTRY
 
-class OnehotDataset(Dataset):
-  def __init__(self, seqs):
-    self.seqs = seqs 
-  def __len__(self):
-    return len(self.seqs)
-  def __getitem__(self, index):
-    return seq_to_one_hot(self.seqs[index])
+METRICS = ('fitness', 'diversity', 'novelty', 'high')
 
 class Evaluator:
-  def __init__(self, protein, max_target, min_target, device, batch_size = 16):
+  def __init__(self, protein, max_target, min_target, device, batch_size = None, oracle_path = None, n_high = None):
     self.device = device 
     self.batch_size = batch_size
     self.max_target, self.min_target = max_target, min_target
-    oracle = BaseCNN(make_one_hot=False)
-    oracle_ckpt = torch.load(f'/home/ubuntu/workspace/plm-rl-protein-design/oracle_lib/ckpt/{protein}/oracle.ckpt', map_location=self.device)
-    if "state_dict" in oracle_ckpt.keys():
-        oracle_ckpt = oracle_ckpt["state_dict"]
-    oracle.load_state_dict({ k.replace('predictor.',''):v for k,v in oracle_ckpt.items() })
-    oracle.eval()
-    self.oracle = oracle.to(device)
-    high = pd.read_csv(f'/home/ubuntu/workspace/plm-rl-protein-design/oracle_lib/data/{protein}/all.csv')[['sequence', 'target']]
-    high = high[high['target'] > high['target'].quantile(q=0.9).item()]
-    self.high = high['sequence'].tolist()
-    self.high = self.high[:128]
+    # oracle_path may point to an exported artifact (*.ts)
+    if oracle_path is None:
+      oracle_path = f'/home/ubuntu/workspace/plm-rl-protein-design/oracle_lib/ckpt/{protein}/oracle.ckpt'
+    self.oracle = REGISTRY.acquire('BaseCNN', oracle_path, device, lambda: load_oracle(oracle_path, device))
+    # memory-mapped binary copy of all.csv, rebuilt when the CSV changes
+    refset = load_refset(f'/home/ubuntu/workspace/plm-rl-protein-design/oracle_lib/data/{protein}/all.csv')
+    # n_high=None keeps the full top decile and loads its index from the cache, n_high=k its first k rows
+    high_idx = refset.sequences[refset.above_quantile(0.9)[:n_high]]
+    self.high = idx_to_seqs(high_idx)
+    self.high_index = refset.high_index(0.9) if n_high is None else HammingIndex(high_idx)
     
-  def evaluate(self, seqs, inits):
-    dataset = OnehotDataset(seqs)
-    dataloader = DataLoader(dataset, batch_size=self.batch_size, shuffle=False)
+  def evaluate(self, seqs, inits, metrics=METRICS):
+    """
+    metrics: subset of METRICS to compute, the others are returned as None
+    """
+    idx = as_idx(seqs)
+    fitness = diversity = novelty = high = None
+    if 'fitness' in metrics:
+      targets = predict_fitness(self.oracle, idx, self.batch_size)
+      targets = (targets - self.min_target) / (self.max_target - self.min_target)
+      fitness = np.median(targets)
+    if 'diversity' in metrics:
+      diversity = hist_median(pairwise_hamming_hist(idx))
+    if 'novelty' in metrics:
+      novelty = np.median(cached_index(inits).query(idx))
+    if 'high' in metrics:
+      high = np.median(self.high_index.query(idx))
 
-    targets = []
-    with torch.no_grad():
-      for batch in dataloader:
-        _, target = self.oracle(batch.to(self.device), get_embed=True)
-        target = (target - self.min_target) / (self.max_target - self.min_target)
-        targets.extend(list(target.cpu().flatten()))
-    fitness = np.median(targets)
-    
-    distances = []
-    for s1, s2 in itertools.combinations(seqs, 2):
-        distances.append(distance(s1, s2))
-    diversity = np.median(distances)
-    
-    distances = []
-    for j in seqs:
-        dist_j = []
-        for i in inits:
-            dist_j.append(distance(i,j))
-        distances.append(min(dist_j))
-    novelty = np.median(distances)
-    
-    distances = []
-    for j in seqs:
-        dist_j = []
-        for i in self.high:
-            dist_j.append(distance(i,j))
-        distances.append(min(dist_j))
-    high = np.median(distances)
+    return fitness, diversity, novelty, high
+
+
+class QuantileSketch:
+  """
+  Mergeable fixed-bin histogram over [lo, hi), out-of-range values land in two edge bins.
+  Quantiles are accurate to one bin width, (hi - lo) / n_bins, and exact min/max are kept.
+  """
+  def __init__(self, lo = -0.5, hi = 1.5, n_bins = 2000):
+    self.lo, self.hi, self.n_bins = lo, hi, n_bins
+    self.width = (hi - lo) / n_bins
+    self.counts = np.zeros(n_bins + 2, dtype=np.int64) # underflow, bins, overflow
+    self.min, self.max = np.inf, -np.inf
+
+  def __len__(self):
+    return int(self.counts.sum())
+
+  def update(self, values):
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+      return
+    bins = np.clip(np.floor((values - self.lo) / self.width), -1, self.n_bins).astype(np.int64) + 1
+    self.counts += np.bincount(bins, minlength=len(self.counts))
+    self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+
+  def merge(self, other):
+    assert (self.lo, self.hi, self.n_bins) == (other.lo, other.hi, other.n_bins), 'Sketches must share their bins'
+    self.counts += other.counts
+    self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+
+  def quantile(self, q):
+    n = len(self)
+    if n == 0:
+      return np.nan
+    b = np.searchsorted(np.cumsum(self.counts), q * (n - 1), side='right')
+    if b == 0:
+      return self.min
+    if b == self.n_bins + 1:
+      return self.max
+    return float(np.clip(self.lo + (b - 0.5) * self.width, self.min, self.max))
+
+
+class StreamingEvaluator:
+  """
+  Running version of Evaluator.evaluate over a growing stream of sequences.
+  update() scores new sequences in batches of `flush_size`. summary() flushes at most flush_size pending
+  sequences and reads fixed-size histograms, so its cost does not grow with the stream.
+    fitness: median from a QuantileSketch of normalized oracle scores
+    diversity: median pairwise distance over a reservoir sample, with a 95% order-statistic interval
+    novelty, high: exact medians of the per-sequence minimum distances to inits / evaluator.high
+  """
+  def __init__(self, evaluator, inits, reservoir_size = 1024, flush_size = 256, seed = 0):
+    self.evaluator = evaluator
+    self.inits_index = cached_index(inits)
+    self.length = self.inits_index.length
+    self.flush_size = flush_size
+    self.rng = np.random.default_rng(seed)
+    self.pending = []
+    self.n = 0
+    self.best = -np.inf
+    self.fitness = QuantileSketch()
+    self.novelty = np.zeros(self.length + 1, dtype=np.int64)
+    self.high = np.zeros(self.length + 1, dtype=np.int64)
+    self.reservoir = np.zeros((reservoir_size, self.length), dtype=np.uint8)
+    self.filled = 0
+    self.pairs = np.zeros(self.length + 1, dtype=np.int64) # pairwise distance counts within the reservoir
+
+  def update(self, new_seqs):
+    self.pending.append(as_idx(new_seqs))
+    if sum(len(idx) for idx in self.pending) >= self.flush_size:
+      self.flush()
+
+  def flush(self):
+    if not self.pending:
+      return
+    idx = np.concatenate([np.asarray(idx, dtype=np.uint8) for idx in self.pending])
+    self.pending = []
+    ev = self.evaluator
+    targets = predict_fitness(ev.oracle, idx, ev.batch_size)
+    targets = (targets - ev.min_target) / (ev.max_target - ev.min_target)
+    self.fitness.update(targets)
+    self.best = max(self.best, float(targets.max()))
+    self.novelty += np.bincount(self.inits_index.query(idx), minlength=self.length + 1)
+    self.high += np.bincount(ev.high_index.query(idx), minlength=self.length + 1)
+    for x in idx:
+      self._sample(x)
 
+  def _sample(self, x):
+    # Algorithm R, keeping the pair histogram in sync with the reservoir
+    self.n += 1
+    if self.filled < len(self.reservoir):
+      j = self.filled
+      self.filled += 1
+    else:
+      j = self.rng.integers(self.n)
+      if j >= len(self.reservoir):
+        return
+      old = (self.reservoir != self.reservoir[j]).sum(axis=1)
+      self.pairs -= np.bincount(old, minlength=self.length + 1)
+      self.pairs[0] += 1 # the slot's distance to itself
+    self.reservoir[j] = x
+    new = (self.reservoir[:self.filled] != x).sum(axis=1)
+    self.pairs += np.bincount(new, minlength=self.length + 1)
+    self.pairs[0] -= 1
 
-    return fitness, diversity, novelty, high
\ No newline at end of file
+  def summary(self):
+    self.flush()
+    # disjoint pairs of the reservoir are independent, use them as the sample size of the interval
+    half_width = 1.96 * 0.5 / np.sqrt(max(self.filled // 2, 1))
+    return {
+      'n': self.n,
+      'fitness': self.fitness.quantile(0.5),
+      'best': self.best,
+      'diversity': hist_median(self.pairs),
+      'diversity_ci': (hist_quantile(self.pairs, max(0.5 - half_width, 0.0)), hist_quantile(self.pairs, min(0.5 + half_width, 1.0))),
+      'novelty': hist_median(self.novelty),
+      'high': hist_median(self.high),
+    }
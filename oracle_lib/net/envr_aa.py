@@ -2,6 +2,7 @@
 Environment for state/action ablation.
 Lat/Mut
 '''
+import os
 import torch 
 import warnings
 import numpy as np
@@ -10,7 +11,10 @@ from gymnasium import Env, spaces
 from utils.constants import REFSEQ, ALPHABET, IDXTOAA, seq_to_one_hot
 from utils.eval_utils import distance
 from net.buffers import * 
-from net.rew import BaseCNN
+from oracle_lib.net.rew import load_oracle, predict_fitness
+from utils.codec import seqs_to_idx
+from utils.oracle_client import OracleClient
+from oracle_lib.utils.registry import REGISTRY
 from net.seq_lm import VED
 from config import * 
 
@@ -31,17 +35,16 @@ class SingleOpt(Env):
         self.oracle_calls = 0
         self.config = config
 
-        oracle = BaseCNN(make_one_hot=False)
-        oracle_ckpt = torch.load(config.rew_pretrained, map_location=self.device)
-        if "state_dict" in oracle_ckpt.keys():
-            oracle_ckpt = oracle_ckpt["state_dict"]
-        oracle.load_state_dict({ k.replace('predictor.',''):v for k,v in oracle_ckpt.items() })
-        oracle.eval()
-        self.oracle = oracle.to(self.device)
+        if config.oracle_server:
+            # shared scoring daemon (serve_oracle.py), keys are relative to its ckpt dir
+            self.oracle = OracleClient(config.oracle_server, os.path.relpath(config.rew_pretrained, 'ckpt'))
+        else:
+            self.oracle = REGISTRY.acquire('BaseCNN', config.rew_pretrained, self.device, lambda: load_oracle(config.rew_pretrained, self.device))
 
-        model = VED(seq_cfg, pretrained=config.seq_pretrained)
-        model.eval()
-        self.model = model.to(self.device)
+        # VED holds two ESM-2 stacks, share one instance between envs of the same process
+        self.model = REGISTRY.acquire('VED', config.seq_pretrained, self.device,
+                                      lambda: VED(seq_cfg, pretrained=config.seq_pretrained).to(self.device),
+                                      config=VED.registry_config(seq_cfg))
 
         data = pd.read_csv('data/{}/{}.csv'.format(config.name, config.level))[["sequence", "target"]]
         data["target"] = (data["target"] - self.config.min_fitness)/self.config.max_fitness
@@ -71,14 +74,18 @@ class SingleOpt(Env):
     def normalize_target(self, target):
         return (target - self.config.min_fitness)/(self.config.max_fitness - self.config.min_fitness)
     
+    def close(self):
+        REGISTRY.release(self.oracle)
+        REGISTRY.release(self.model)
+
     def reset(self, seed=422):
         self.state_seq, self.buffer_idx = self.buffer.top()
         self.init_seq = self.state_seq
         with torch.no_grad():
             state = self.model.encode(self.state_seq)
             self.state = state.cpu().view(-1)
-            _, target = self.oracle(seq_to_one_hot(self.state_seq).unsqueeze(0).to(self.device), get_embed=True)
-            self.init_target = self.target = target = self.normalize_target(target.cpu().item())
+            target = predict_fitness(self.oracle, seqs_to_idx([self.state_seq]))[0]
+            self.init_target = self.target = target = self.normalize_target(target)
         self.ep += 1
         self.steps = 0
         self.total_steps += 1
@@ -101,9 +108,6 @@ class SingleOpt(Env):
         
         next_seq = self.state_seq[:pos] + IDXTOAA[aa] + self.state_seq[pos+1:]
         self.n_mut = distance(self.wt_seq, next_seq)
-        
-        with torch.no_grad():
-            next_state = self.model.encode(next_seq)
             
         self.done = done = step_mut == 0 or self.steps > self.done_cond.max_steps or self.n_mut > self.done_cond.max_mutation 
         called = False
@@ -112,8 +116,8 @@ class SingleOpt(Env):
         if self.config.not_sparse or done:
             self.oracle_calls += 1
             with torch.no_grad():
-                _, target = self.oracle(seq_to_one_hot(next_seq).unsqueeze(0).to(self.device), get_embed=True)
-            target = self.normalize_target(target.cpu().item())
+                target = predict_fitness(self.oracle, seqs_to_idx([next_seq]))[0]
+            target = self.normalize_target(target)
             self.reward = target
             self.buffer.push((next_seq, target, self.buffer_idx))
             if target > self.best_discovered:
@@ -123,7 +127,13 @@ class SingleOpt(Env):
         else:
             self.reward = 0
         
-        self.state = next_state.cpu().numpy()[0]
+        if done:
+            # the terminal observation is dropped on reset (it is only bootstrapped from on TimeLimit.truncated,
+            # which this env never sets), so skip the encoder forward
+            self.state = np.zeros(self.observation_space.shape, dtype=np.float32)
+        else:
+            with torch.no_grad():
+                self.state = self.model.encode(next_seq).cpu().numpy()[0]
         self.state_seq = next_seq
             
         if done:
@@ -2,6 +2,7 @@
 Environment for state/action ablation.
 Seq/Mut
 '''
+import os
 import torch 
 import warnings
 import numpy as np
@@ -10,7 +11,10 @@ from gymnasium import Env, spaces
 from utils.constants import REFSEQ, ALPHABET, IDXTOAA, seq_to_one_hot
 from utils.eval_utils import distance
 from net.buffers import * 
-from net.rew import BaseCNN
+from oracle_lib.net.rew import load_oracle, predict_fitness
+from utils.codec import seqs_to_idx
+from utils.oracle_client import OracleClient
+from oracle_lib.utils.registry import REGISTRY
 from config import * 
 
 warnings.filterwarnings('ignore')
@@ -30,13 +34,11 @@ class SingleOpt(Env):
         self.oracle_calls = 0
         self.config = config
 
-        oracle = BaseCNN(make_one_hot=False)
-        oracle_ckpt = torch.load(config.rew_pretrained, map_location=self.device)
-        if "state_dict" in oracle_ckpt.keys():
-            oracle_ckpt = oracle_ckpt["state_dict"]
-        oracle.load_state_dict({ k.replace('predictor.',''):v for k,v in oracle_ckpt.items() })
-        oracle.eval()
-        self.oracle = oracle.to(self.device)
+        if config.oracle_server:
+            # shared scoring daemon (serve_oracle.py), keys are relative to its ckpt dir
+            self.oracle = OracleClient(config.oracle_server, os.path.relpath(config.rew_pretrained, 'ckpt'))
+        else:
+            self.oracle = REGISTRY.acquire('BaseCNN', config.rew_pretrained, self.device, lambda: load_oracle(config.rew_pretrained, self.device))
         
         data = pd.read_csv('data/{}/{}.csv'.format(config.name, config.level))[["sequence", "target"]]
         data["target"] = (data["target"] - self.config.min_fitness)/self.config.max_fitness
@@ -65,13 +67,16 @@ class SingleOpt(Env):
     def normalize_target(self, target):
         return (target - self.config.min_fitness)/(self.config.max_fitness - self.config.min_fitness)
     
+    def close(self):
+        REGISTRY.release(self.oracle)
+
     def reset(self, seed=422):
         self.state_seq, self.buffer_idx = self.buffer.top()
         self.init_seq = self.state_seq
         self.state = seq_to_one_hot(self.state_seq).numpy()
         with torch.no_grad():
-            _, target = self.oracle(seq_to_one_hot(self.state_seq).unsqueeze(0).to(self.device), get_embed=True)
-            self.init_target = self.target = target = self.normalize_target(target.cpu().item())
+            target = predict_fitness(self.oracle, seqs_to_idx([self.state_seq]))[0]
+            self.init_target = self.target = target = self.normalize_target(target)
         self.ep += 1
         self.steps = 0
         self.total_steps += 1
@@ -102,8 +107,8 @@ class SingleOpt(Env):
         if self.config.not_sparse or done:
             self.oracle_calls += 1
             with torch.no_grad():
-                _, target = self.oracle(seq_to_one_hot(next_seq).unsqueeze(0).to(self.device), get_embed=True)
-            target = self.normalize_target(target.cpu().item())
+                target = predict_fitness(self.oracle, seqs_to_idx([next_seq]))[0]
+            target = self.normalize_target(target)
             self.reward = target
             self.buffer.push((next_seq, target, self.buffer_idx))
             if target > self.best_discovered:
@@ -13,7 +13,10 @@ from gymnasium import Env, spaces
 import warnings
 from utils.constants import REFSEQ, ALPHABET, seq_to_one_hot
 from utils.eval_utils import distance
-from net.rew import BaseCNN
+from oracle_lib.net.rew import BaseCNN, load_oracle, predict_fitness
+from utils.codec import seqs_to_idx
+from utils.oracle_client import OracleClient
+from oracle_lib.utils.registry import REGISTRY
 from net.seq_lm import VED
 from config import * 
 from net.buffers import * 
@@ -51,13 +54,11 @@ class DoubleOpt(Env):
         self.oracle_rounds = [0, 3, 6, 9, 12]
         self.predictor_rounds = [1, 4, 7, 10, 13]
 
-        oracle = BaseCNN(make_one_hot=False)
-        oracle_ckpt = torch.load(f'ckpt/{self.protein}/oracle.ckpt', map_location=self.device)
-        if "state_dict" in oracle_ckpt.keys():
-            oracle_ckpt = oracle_ckpt["state_dict"]
-        oracle.load_state_dict({ k.replace('predictor.',''):v for k,v in oracle_ckpt.items() })
-        oracle.eval()
-        self.oracle = oracle.to(self.device)
+        if config.oracle_server:
+            self.oracle = OracleClient(config.oracle_server, f'{self.protein}/oracle.ckpt')
+        else:
+            oracle_path = f'ckpt/{self.protein}/oracle.ckpt'
+            self.oracle = REGISTRY.acquire('BaseCNN', oracle_path, self.device, lambda: load_oracle(oracle_path, self.device))
         
         predictor = BaseCNN(make_one_hot=False)
         predictor_ckpt = torch.load(f'ckpt/{self.protein}/{config.level}.ckpt', map_location=self.device)
@@ -67,9 +68,10 @@ class DoubleOpt(Env):
         predictor.eval()
         self.predictor = predictor.to(self.device)
 
-        model = VED(seq_cfg, pretrained=config.seq_pretrained)
-        model.eval()
-        self.model = model.to(self.device)
+        # VED holds two ESM-2 stacks, share one instance between envs of the same process
+        self.model = REGISTRY.acquire('VED', config.seq_pretrained, self.device,
+                                      lambda: VED(seq_cfg, pretrained=config.seq_pretrained).to(self.device),
+                                      config=VED.registry_config(seq_cfg))
 
         data = pd.read_csv('data/{}/{}.csv'.format(config.name, config.level))[["sequence", "target"]]
         data["target"] = (data["target"] - self.config.min_fitness)/self.config.max_fitness
@@ -105,6 +107,10 @@ class DoubleOpt(Env):
                 self.aa[j] += 1
                 self.pos[pos] += 1
     
+    def close(self):
+        REGISTRY.release(self.oracle)
+        REGISTRY.release(self.model)
+
     def reset(self, seed=422):
         self.state_seq, self.buffer_idx = self.buffer.top()
         self.init_seq = self.state_seq
@@ -159,9 +165,9 @@ class DoubleOpt(Env):
                         self.predictor.eval()
                 reward_fn = self.oracle if self.rounds in self.oracle_rounds else self.predictor
                 with torch.no_grad():
-                    _, target = reward_fn(seq_to_one_hot(next_seq).unsqueeze(0).to(self.device), get_embed=True)
-                self.pred_data.append([next_seq, target.cpu().item()])
-                target = self.normalize_target(target.cpu().item())
+                    target = predict_fitness(reward_fn, seqs_to_idx([next_seq]))[0]
+                self.pred_data.append([next_seq, target])
+                target = self.normalize_target(target)
                 self.reward = target
                 self.buffer.push((next_seq, target, self.buffer_idx))
                 if target > self.best_discovered:
@@ -1,6 +1,7 @@
 '''
 Reference: GGS (https://github.com/kirjner/GGS)
 '''
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -42,6 +43,7 @@ class LengthMaxPool1D(nn.Module):
     def __init__(self, in_dim, out_dim, linear=False, activation='relu'):
         super().__init__()
         self.linear = linear
+        self.activation = activation
         if self.linear:
             self.layer = nn.Linear(in_dim, out_dim)
 
@@ -117,3 +119,352 @@ class BaseCNN(nn.Module):
         if get_embed:
             return x, output
         return output
+
+
+class StackedCNN(nn.Module):
+    """ An ensemble of independent BaseCNN members evaluated in one batched forward.
+
+    Like FusedCNN, each member's convolution and per-position Linear are folded into one map over the
+    one-hot window of each position. With one-hot input that map is a lookup table, so all members are
+    scored with a single embedding_bag over the residue windows. The table is rebuilt from the
+    parameters on every forward, which keeps training exact.
+
+         Shape:
+            Input: (N, L) residue indices
+            Output: (N, n_models)
+    """
+
+    def __init__(
+            self,
+            n_models: int,
+            n_tokens: int = 20,
+            kernel_size: int = 5,
+            input_size: int = 256):
+        super().__init__()
+        self.n_models = n_models
+        self.n_tokens = n_tokens
+        self.kernel_size = kernel_size
+        self.input_size = input_size
+        self._make_one_hot = True # consumes residue indices directly
+        # Conv1d initializes from fan_in = n_tokens * kernel_size, the same as n_models separate convolutions
+        self.encoder = nn.Conv1d(n_tokens, n_models * input_size, kernel_size=kernel_size)
+        self.weight = nn.Parameter(torch.empty(n_models, input_size, input_size * 2))
+        self.bias = nn.Parameter(torch.empty(n_models, input_size * 2))
+        self.decoder_weight = nn.Parameter(torch.empty(n_models, input_size * 2))
+        self.decoder_bias = nn.Parameter(torch.empty(n_models))
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        # nn.Linear's default initialization, member by member
+        for fan_in, params in ((self.input_size, (self.weight, self.bias)),
+                               (self.input_size * 2, (self.decoder_weight, self.decoder_bias))):
+            for p in params:
+                nn.init.uniform_(p, -fan_in ** -0.5, fan_in ** -0.5)
+
+    def forward(self, x):
+        K, T, M = self.kernel_size, self.n_tokens, self.n_models
+        conv = self.encoder.weight.view(M, self.input_size, T, K)
+        # row k*T + t holds every member's hidden response to token t at window offset k
+        table = torch.einsum('mctk,mco->ktmo', conv, self.weight).reshape(K * T, -1)
+        bias = torch.einsum('mc,mco->mo', self.encoder.bias.view(M, -1), self.weight) + self.bias
+        windows = x.long().unfold(1, K, 1) + torch.arange(K, device=x.device) * T
+        h = F.embedding_bag(windows.reshape(-1, K), table, mode='sum')
+        h = h.view(x.size(0), -1, M, self.input_size * 2) + bias
+        h = torch.max(F.relu(h), dim=1)[0]
+        return (h * self.decoder_weight).sum(-1) + self.decoder_bias
+
+    def member(self, i: int) -> BaseCNN:
+        """ Copy of member `i` as a standalone BaseCNN. """
+        H = self.input_size
+        model = BaseCNN(n_tokens=self.n_tokens, kernel_size=self.kernel_size, input_size=H)
+        with torch.no_grad():
+            model.encoder.weight.copy_(self.encoder.weight[i * H:(i + 1) * H])
+            model.encoder.bias.copy_(self.encoder.bias[i * H:(i + 1) * H])
+            model.embedding.layer.weight.copy_(self.weight[i].T)
+            model.embedding.layer.bias.copy_(self.bias[i])
+            model.decoder.weight.copy_(self.decoder_weight[i][None])
+            model.decoder.bias.copy_(self.decoder_bias[i][None])
+        return model.to(self.encoder.weight.device)
+
+
+class FusedCNN(nn.Module):
+    """ Inference-only BaseCNN for export.
+
+    The width-k convolution and the per-position Linear have no nonlinearity in between, so both are
+    folded into one Linear over the flattened one-hot window of each position. Only Linear layers remain,
+    which keeps the module scriptable and lets torch.ao.quantization.quantize_dynamic cover all of it.
+
+         Shape:
+            Input: (N, L) residue indices
+            Output: (N,)
+    """
+
+    def __init__(self, model: BaseCNN):
+        super().__init__()
+        encoder, embedding = model.encoder, model.embedding
+        assert encoder.stride[0] == 1 and encoder.dilation[0] == 1 and encoder.padding[0] == 0
+        self.n_tokens = model.n_tokens
+        self.kernel_size = encoder.kernel_size[0]
+        # conv weight (C, T, K) -> (C, K*T) matching windows flattened as [offset, token]
+        weight = encoder.weight.detach().permute(0, 2, 1).reshape(encoder.out_channels, -1)
+        bias = encoder.bias.detach()
+        self.activate = embedding.linear
+        if embedding.linear:
+            if embedding.activation != 'relu':
+                raise NotImplementedError('Only relu activations can be exported')
+            layer = embedding.layer
+            weight = layer.weight.detach() @ weight
+            bias = layer.weight.detach() @ bias + layer.bias.detach()
+        self.window = nn.Linear(weight.size(1), weight.size(0))
+        self.window.weight.data.copy_(weight)
+        self.window.bias.data.copy_(bias)
+        self.decoder = nn.Linear(model.decoder.in_features, 1)
+        self.decoder.load_state_dict(model.decoder.state_dict())
+
+    def forward(self, x):
+        x = F.one_hot(x.long(), num_classes=self.n_tokens).float()
+        # (N, L', T, K) -> (N, L', K*T)
+        x = x.unfold(1, self.kernel_size, 1).transpose(2, 3).flatten(2)
+        x = self.window(x)
+        if self.activate:
+            x = F.relu(x)
+        x = torch.max(x, dim=1)[0]
+        return self.decoder(x).squeeze(1)
+
+
+class ExportedOracle(nn.Module):
+    """ Wraps a TorchScript FusedCNN artifact so it can stand in for BaseCNN in predict_fitness. """
+
+    def __init__(self, module, device):
+        super().__init__()
+        self.module = module
+        self.device = torch.device(device)
+        self.n_tokens = 20
+        self._make_one_hot = True # consumes residue indices directly
+
+    def forward(self, x):
+        return self.module(x)
+
+
+def load_oracle(path: str, device) -> nn.Module:
+    """ BaseCNN from a training checkpoint, or an exported TorchScript artifact (*.ts). """
+    if path.endswith('.ts'):
+        oracle = ExportedOracle(torch.jit.load(path, map_location=device), device)
+        oracle.eval()
+        return oracle
+    oracle = BaseCNN(make_one_hot=False)
+    oracle_ckpt = torch.load(path, map_location=device)
+    if "state_dict" in oracle_ckpt.keys():
+        oracle_ckpt = oracle_ckpt["state_dict"]
+    oracle.load_state_dict({ k.replace('predictor.',''):v for k,v in oracle_ckpt.items() })
+    oracle.eval()
+    return oracle.to(device)
+
+
+def model_device(model: nn.Module) -> torch.device:
+    # exported artifacts keep their weights as TorchScript constants and record their device
+    if isinstance(getattr(model, 'device', None), torch.device):
+        return model.device
+    return next(model.parameters()).device
+
+
+def single_mutants(parent, n_tokens: int, chunk_size: int):
+    """ Yields chunks of at most `chunk_size` single-site substitutions of `parent`, built on its device.
+
+    Chunks enumerate position-major: variant v has residue v % n_tokens at position v // n_tokens.
+    """
+    device = parent.device
+    for variants in torch.arange(parent.size(0) * n_tokens, device=device).split(chunk_size):
+        children = parent.repeat(variants.size(0), 1)
+        children[torch.arange(variants.size(0), device=device), variants // n_tokens] = variants % n_tokens
+        yield children
+
+
+def auto_batch_size(model: BaseCNN, length: int, max_batch_bytes: int = 2**28) -> int:
+    """ Largest batch whose float32 activations (one-hot, conv, per-position linear) fit in `max_batch_bytes`. """
+    input_size = getattr(model, 'input_size', 256) * getattr(model, 'n_models', 1)
+    per_seq = 4 * length * (model.n_tokens + 3 * input_size)
+    return max(1, max_batch_bytes // max(1, per_seq))
+
+
+def predict_fitness(model: BaseCNN, idx, batch_size: int = None, max_batch_bytes: int = 2**28):
+    """ Batched BaseCNN inference without a DataLoader.
+
+    The model is used in its current mode; call model.eval() first.
+
+         Shape:
+            idx: (N, L) residue indices (numpy or torch, any integer dtype)
+            Output: (N,) contiguous float64 numpy array, (N, n_models) for a StackedCNN
+    """
+    if not isinstance(model, nn.Module):
+        # remote oracles (utils.oracle_client.OracleClient) batch on the server
+        return model.get_fitness(idx)
+    device = model_device(model)
+    idx = torch.as_tensor(idx)
+    if idx.dim() == 1:
+        idx = idx.unsqueeze(0)
+    if idx.size(0) == 0:
+        return np.empty((0, model.n_models) if hasattr(model, 'n_models') else 0, dtype=np.float64)
+    if idx.size(1) == 0:
+        raise ValueError(f'cannot score {idx.size(0)} sequences of length 0')
+    if batch_size is None:
+        batch_size = auto_batch_size(model, idx.size(1), max_batch_bytes)
+    scores = np.empty((idx.size(0), model.n_models) if hasattr(model, 'n_models') else idx.size(0), dtype=np.float64)
+    with torch.inference_mode():
+        for start in range(0, idx.size(0), batch_size):
+            x = idx[start:start + batch_size].to(device, non_blocking=True).long()
+            if not model._make_one_hot:
+                x = F.one_hot(x, num_classes=model.n_tokens)
+            scores[start:start + batch_size] = model(x).cpu().numpy()
+    return scores
+
+
+def scan_fitness(model: nn.Module, parent, chunk_size: int = 2048, batch_size: int = None):
+    """ Deep mutational scan by full forwards, for oracles without an IncrementalScorer.
+
+         Shape:
+            parent: (L,) residue indices
+            Output: (L, n_tokens) numpy array
+    """
+    parent = torch.as_tensor(parent, device=model_device(model)).long()
+    scores = [predict_fitness(model, children, batch_size) for children in single_mutants(parent, model.n_tokens, chunk_size)]
+    return np.concatenate(scores).reshape(parent.size(0), model.n_tokens)
+
+
+class IncrementalScorer:
+    """ Scores children that differ from cached parents at a few positions.
+
+    BaseCNN applies an unpadded width-k convolution, a per-position Linear and a max over length,
+    so a point mutation only changes the k windows covering it. The per-window hidden activations
+    of each parent are cached; for a child only the affected windows are recomputed and the max is
+    re-reduced from the parent's per-channel top-t activations that fall outside those windows.
+    Scores match BaseCNN.forward up to float rounding.
+
+    Call set_parents again after the model weights change.
+
+         Shape:
+            parents: (P, L) residue indices
+            children: (B, L) residue indices, parent_ids: (B,)
+            Output: (B,)
+    """
+
+    @staticmethod
+    def supports(model: nn.Module) -> bool:
+        """ Whether `model` has the single BaseCNN layout this scorer reads (conv encoder, max-pool embedding, decoder).
+
+        Checked by capability rather than class, so a BaseCNN imported through another module path still qualifies;
+        ensembles (n_models) and exported artifacts do not.
+        """
+        return (isinstance(getattr(model, 'encoder', None), nn.Conv1d) and hasattr(model, 'embedding')
+                and isinstance(getattr(model, 'decoder', None), nn.Linear) and not hasattr(model, 'n_models'))
+
+    def __init__(self, model: BaseCNN, topk: int = 8):
+        """
+        :param model: BaseCNN oracle
+        :param topk: per-channel parent activations kept for re-reducing the max
+        """
+        encoder = model.encoder
+        assert encoder.stride[0] == 1 and encoder.dilation[0] == 1 and encoder.padding[0] == 0
+        self.model = model
+        self.kernel_size = encoder.kernel_size[0]
+        self.topk = topk
+        self.parents = None
+
+    def _device(self):
+        return self.model.decoder.weight.device
+
+    def _hidden(self, x):
+        if self.model.embedding.linear:
+            x = self.model.embedding.act_fn(self.model.embedding.layer(x))
+        return x
+
+    def _cache_hidden(self, hidden):
+        self.parent_hidden = hidden
+        t = min(self.topk, hidden.size(1))
+        top_vals, top_idx = torch.topk(hidden, t, dim=1)
+        # (P, H, t) so the re-reduction runs over the last dim
+        self.top_vals = top_vals.transpose(1, 2).contiguous()
+        self.top_idx = top_idx.transpose(1, 2).contiguous()
+        return self.model.decoder(top_vals[:, 0]).squeeze(-1)
+
+    @torch.no_grad()
+    def set_parents(self, parents):
+        """ Full forward over the parents; returns their scores. """
+        parents = torch.as_tensor(parents, device=self._device()).long()
+        if parents.dim() == 1:
+            parents = parents.unsqueeze(0)
+        # (K, n_tokens, C): conv weight per kernel offset and residue
+        self._weight = self.model.encoder.weight.permute(2, 1, 0).contiguous()
+        self._bias = self.model.encoder.bias
+        x = F.one_hot(parents, num_classes=self.model.n_tokens).permute(0, 2, 1).float()
+        x = self.model.encoder(x).permute(0, 2, 1)
+        self.parents = parents
+        return self._cache_hidden(self._hidden(x))
+
+    @torch.no_grad()
+    def score(self, children, parent_ids=None, update=False):
+        """
+        :param children: (B, L) residue indices
+        :param parent_ids: (B,) index of each child's parent, defaults to parent 0
+        :param update: replace the cached parents by the children so rollouts can continue from them
+        """
+        assert self.parents is not None, 'call set_parents first'
+        device = self._device()
+        children = torch.as_tensor(children, device=device).long()
+        if children.dim() == 1:
+            children = children.unsqueeze(0)
+        if parent_ids is None:
+            parent_ids = torch.zeros(children.size(0), dtype=torch.long, device=device)
+        parent_ids = torch.as_tensor(parent_ids, device=device).long()
+        n_children = children.size(0)
+
+        # windows covering at least one mutated position
+        diff = children != self.parents[parent_ids]
+        affected = diff.unfold(1, self.kernel_size, 1).any(-1)  # (B, L')
+        b_idx, j_idx = affected.nonzero(as_tuple=True)
+
+        offsets = torch.arange(self.kernel_size, device=device)
+        windows = children[b_idx.unsqueeze(1), j_idx.unsqueeze(1) + offsets]  # (M, K)
+        pre = self._weight[offsets, windows].sum(1) + self._bias
+        hidden = self._hidden(pre)  # (M, H)
+
+        if update:
+            child_hidden = self.parent_hidden[parent_ids].clone()
+            child_hidden[b_idx, j_idx] = hidden
+            self.parents = children
+            return self._cache_hidden(child_hidden)
+
+        # max over unaffected windows: best parent top-t entry outside the affected windows
+        if self.parents.size(0) == 1:
+            top_idx = self.top_idx.expand(n_children, -1, -1)
+            top_vals = self.top_vals.expand(n_children, -1, -1)
+        else:
+            top_idx = self.top_idx[parent_ids]  # (B, H, t)
+            top_vals = self.top_vals[parent_ids]
+        excluded = torch.gather(affected, 1, top_idx.reshape(n_children, -1)).view(top_idx.shape)
+        embed = top_vals.masked_fill(excluded, float('-inf')).amax(-1)  # (B, H)
+        exhausted = excluded.all(-1)
+        if exhausted.any():
+            rows = exhausted.any(-1).nonzero(as_tuple=True)[0]
+            masked = self.parent_hidden[parent_ids[rows]].masked_fill(affected[rows].unsqueeze(-1), float('-inf'))
+            embed[rows] = torch.where(exhausted[rows], masked.max(1)[0], embed[rows])
+
+        # max over recomputed windows
+        embed = embed.scatter_reduce(0, b_idx.unsqueeze(1).expand_as(hidden), hidden, reduce='amax')
+        return self.model.decoder(embed).squeeze(-1)
+
+    @torch.no_grad()
+    def scan(self, parent, chunk_size: int = 2048):
+        """ Deep mutational scan: scores of every single-site substitution of `parent`.
+
+        Variants are built on the model's device chunk by chunk, so at most `chunk_size` of them
+        are held in memory. Replaces the cached parents by `parent`.
+
+             Shape:
+                parent: (L,) residue indices
+                Output: (L, n_tokens), entry [i, a] scores `parent` with residue a at position i
+        """
+        self.set_parents(parent)
+        parent = self.parents[0]
+        scores = [self.score(children) for children in single_mutants(parent, self.model.n_tokens, chunk_size)]
+        return torch.cat(scores).view(parent.size(0), self.model.n_tokens)
@@ -1,22 +1,106 @@
+import copy
 import esm
+import hashlib
+import os
 import torch 
 import torch.nn as nn 
+from collections import OrderedDict
 from esm import ESM2
+from utils.esm_tokens import ESM_TOKENS, AA_OFFSET, N_AA_TOKENS, AA_TOKEN_TO_IDX, encode_tokens, tokens_to_idx
+from net.student import load_student
+from utils.codec import seqs_to_idx, idx_to_seqs
+
+def load(path, mmap=True):
+    """torch.load onto the CPU, memory-mapped when the file is in the zip format."""
+    if mmap:
+        try:
+            return torch.load(path, map_location='cpu', mmap=True)
+        except RuntimeError:
+            # legacy (non-zip) checkpoints cannot be memory-mapped
+            pass
+    return torch.load(path, map_location='cpu')
+
+def prefixed(state_dict, prefix):
+    return {k[len(prefix):]: v for k, v in state_dict.items() if k.startswith(prefix)}
     
 class VED(nn.Module):
-    def __init__(self, cfg, pretrained=None, esm_pretrained=None):
+    def __init__(self, cfg, pretrained=None, esm_pretrained=None, encode_cache_size=4096):
         super().__init__()
         assert pretrained == None or esm_pretrained == None, 'Both VED checkpoint and ESM-2 checkpoint are given'
         
         self.alphabet = esm.data.Alphabet.from_architecture("ESM-1b")
-        self.batch_converter = self.alphabet.get_batch_converter()
+        assert tuple(self.alphabet.all_toks) == ESM_TOKENS, 'ESM-1b alphabet differs from utils.esm_tokens'
         self.device = cfg.device
         self.esm_num_layers = cfg.num_layers
         self.num_tokens = cfg.num_tokens
         self.cfg = cfg
 
+        # sequence hash -> CLS - WT representation before `reduce`, reset sequences come from a slowly changing buffer
+        self.encode_cache_size = encode_cache_size
+        self.encode_cache = OrderedDict()
+        self.encode_hits = 0
+        self.encode_misses = 0
+        self.wt_seq = None
+        self.n_shared = 0 # lm submodules reused from the encoder
+        self.student = None # distilled encoder replacing encoder + reduce, see use_student
+        self.student_wt = None
+
+        if not cfg.lean_load:
+            self.legacy_init(cfg, pretrained, esm_pretrained)
+            if cfg.student_pretrained != None:
+                self.use_student(*load_student(cfg.student_pretrained, 'cpu'))
+            return
+
+        # checkpoints are memory-mapped, and the ESM-2 stacks are assigned their tensors without a random init
+        if pretrained == None:
+            encoder_state, strict = self.load_esm_ckpt('ckpt/esm2_t33_650M_UR50D.pt'), False
+            lm_state = self.load_esm_ckpt(esm_pretrained)
+        else:
+            ckpt, strict = self.load_ckpt(pretrained), True
+            encoder_state, lm_state = prefixed(ckpt, 'encoder.'), prefixed(ckpt, 'lm.')
+
+        self.encoder = self.build_esm(cfg, encoder_state, strict)
+        self.encoder.requires_grad_(False)
+        self.reduce = nn.Sequential(
+            nn.Linear(cfg.embed_dim, cfg.reduce_dim),
+            nn.Tanh()
+        )
+
+        self.lm = self.build_esm(cfg, lm_state, strict)
+        self.lm.requires_grad_(False)
+        for i, layer in enumerate(self.lm.layers):
+            if i < cfg.num_trainable_layers:
+                layer.requires_grad_ = True 
+                
+        self.rep_recover = nn.Sequential(
+            nn.Linear(cfg.reduce_dim, cfg.embed_dim),
+            nn.LeakyReLU(),
+            nn.Linear(cfg.embed_dim, cfg.embed_dim)
+        )
+
+        if pretrained != None:
+            unexpected = [k for k in ckpt if not k.startswith(('encoder.', 'lm.', 'reduce.', 'rep_recover.', 'student.'))]
+            if unexpected:
+                raise RuntimeError(f'Unexpected key(s) in VED checkpoint: {unexpected}')
+            self.reduce.load_state_dict(prefixed(ckpt, 'reduce.'))
+            self.rep_recover.load_state_dict(prefixed(ckpt, 'rep_recover.'))
+            # only for inference checkpoints, a shared module would tie lm fine-tuning to the frozen encoder
+            self.n_shared = self.share_identical()
+        self.set_encoder_dtype(cfg.encoder_dtype)
+        if cfg.student_pretrained != None:
+            self.use_student(*load_student(cfg.student_pretrained, 'cpu'))
+
+    @staticmethod
+    def registry_config(cfg) -> tuple:
+        """Settings besides the checkpoint path that change the loaded model, part of its REGISTRY key."""
+        student = cfg.student_pretrained
+        return (('lean_load', bool(cfg.lean_load)), ('encoder_dtype', cfg.encoder_dtype),
+                ('student_pretrained', None if student == None else os.path.realpath(student)))
+
+    def legacy_init(self, cfg, pretrained, esm_pretrained):
+        """Eager loading kept for comparison: random init, two full torch.loads, no sharing."""
         self.encoder = ESM2(num_layers=cfg.num_layers, embed_dim=cfg.embed_dim, attention_heads=20, alphabet=self.alphabet, token_dropout=False)
-        self.encoder.load_state_dict(self.load_esm_ckpt('ckpt/esm2_t33_650M_UR50D.pt'), strict=False)
+        self.encoder.load_state_dict(self.load_esm_ckpt('ckpt/esm2_t33_650M_UR50D.pt', mmap=False), strict=False)
         self.encoder.requires_grad_(False)
         self.reduce = nn.Sequential(
             nn.Linear(cfg.embed_dim, cfg.reduce_dim),
@@ -36,13 +120,85 @@ class VED(nn.Module):
         )
 
         if pretrained == None:
-            self.lm.load_state_dict(self.load_esm_ckpt(esm_pretrained), strict=False)
+            self.lm.load_state_dict(self.load_esm_ckpt(esm_pretrained, mmap=False), strict=False)
         else:
-            self.load_state_dict(self.load_ckpt(pretrained))
+            self.load_state_dict(self.load_ckpt(pretrained, mmap=False))
+
+    def build_esm(self, cfg, state_dict, strict):
+        """
+        ESM-2 stack holding the tensors of `state_dict` (no copy) when the checkpoint covers all of its
+        parameters and buffers, otherwise a randomly initialised stack the checkpoint is loaded into.
+        """
+        kwargs = dict(num_layers=cfg.num_layers, embed_dim=cfg.embed_dim, attention_heads=20, alphabet=self.alphabet, token_dropout=False)
+        with torch.device('meta'):
+            model = ESM2(**kwargs)
+        persistent = set(model.state_dict())
+        # non-persistent buffers are not in any checkpoint and cannot be recovered from the meta device
+        if {name for name, _ in model.named_buffers()} <= persistent and persistent <= set(state_dict):
+            model.load_state_dict({k: state_dict[k] for k in persistent}, strict=strict, assign=True)
+            return model
+        model = ESM2(**kwargs)
+        model.load_state_dict(state_dict, strict=strict)
+        return model
+
+    def share_identical(self):
+        """Let `lm` reuse every `encoder` submodule whose tensors are bit-identical, returns how many were shared."""
+        pairs = [('embed_tokens', None), ('emb_layer_norm_after', None)] + [('layers', i) for i in range(len(self.lm.layers))]
+        shared = 0
+        for name, i in pairs:
+            enc, lm = getattr(self.encoder, name), getattr(self.lm, name)
+            if i is not None:
+                enc, lm = enc[i], lm[i]
+            if enc is lm:
+                continue
+            enc_state, lm_state = enc.state_dict(), lm.state_dict()
+            if enc_state.keys() == lm_state.keys() and all(
+                enc_state[k].dtype == lm_state[k].dtype and torch.equal(enc_state[k], lm_state[k]) for k in enc_state
+            ):
+                if i is None:
+                    setattr(self.lm, name, enc)
+                else:
+                    self.lm.layers[i] = enc
+                if name == 'embed_tokens':
+                    # the tied lm_head projection has to follow the embedding
+                    self.lm.lm_head.weight = enc.weight
+                shared += 1
+        return shared
+
+    def set_encoder_dtype(self, dtype):
+        """
+        Store the frozen encoder in reduced precision: None (float32), 'bf16' or 'int8' (dynamic, CPU only).
+        Modules shared with `lm` are unshared first, the decoder always runs in float32.
+        """
+        if dtype == None:
+            return
+        if dtype not in ('bf16', 'int8'):
+            raise ValueError(f"encoder_dtype must be None, 'bf16' or 'int8', got {dtype!r}")
+        if dtype == 'int8' and torch.device(self.device).type != 'cpu':
+            raise ValueError('int8 encoder is only supported on CPU')
+        lm_modules = {id(m) for m in self.lm.modules()}
+        if any(id(m) in lm_modules for m in self.encoder.modules()):
+            self.unshare()
+        if dtype == 'bf16':
+            self.encoder.to(torch.bfloat16)
+        else:
+            torch.ao.quantization.quantize_dynamic(self.encoder, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        self.encode_cache.clear()
+
+    def unshare(self):
+        for name in ('embed_tokens', 'emb_layer_norm_after'):
+            if getattr(self.lm, name) is getattr(self.encoder, name):
+                setattr(self.lm, name, copy.deepcopy(getattr(self.encoder, name)))
+        for i, layer in enumerate(self.lm.layers):
+            if layer is self.encoder.layers[i]:
+                self.lm.layers[i] = copy.deepcopy(layer)
+        if self.lm.lm_head.weight is self.encoder.embed_tokens.weight:
+            self.lm.lm_head.weight = self.lm.embed_tokens.weight
+        self.n_shared = 0
 
-    def load_esm_ckpt(self, esm_pretrained):
+    def load_esm_ckpt(self, esm_pretrained, mmap=True):
         ckpt = {}
-        model_data = torch.load(esm_pretrained)["model"]
+        model_data = load(esm_pretrained, mmap)["model"]
         for k in model_data:
             if 'lm_head' in k:
                 ckpt[k.replace('encoder.','')] = model_data[k]
@@ -50,24 +206,41 @@ class VED(nn.Module):
                 ckpt[k.replace('encoder.sentence_encoder.','')] = model_data[k]
         return ckpt
 
-    def load_ckpt(self, pretrained):
+    def load_ckpt(self, pretrained, mmap=True):
         ckpt = {}
-        model_data = torch.load(pretrained, map_location=self.device)
+        # memory-mapped checkpoints stay on the CPU until the model is moved
+        model_data = load(pretrained, mmap) if mmap else torch.load(pretrained, map_location=self.device)
         for k in model_data:
             ckpt[k.replace('module.','')] = model_data[k]
         return ckpt
     
     def compose_input(self, list_tuple_seq):
-        _, _, batch_tokens = self.batch_converter(list_tuple_seq)
+        batch_tokens = encode_tokens([seq for _, seq in list_tuple_seq])
         batch_tokens = batch_tokens.to(self.device)
         return batch_tokens 
 
+    def use_student(self, student, wt):
+        """
+        Encode with a distilled student (net/student.py) instead of the ESM-2 encoder and `reduce`.
+        The student was trained against `wt`, set_wt_tokens refuses any other WT while it is in use.
+        """
+        if self.wt_seq != None and self.wt_seq != wt:
+            raise ValueError('student encoder was distilled against a different WT sequence')
+        self.student = student
+        self.student_wt = wt
+
     def set_wt_tokens(self, wt_seq):
+        if self.student != None and wt_seq != self.student_wt:
+            raise ValueError('student encoder was distilled against a different WT sequence')
+        # cached representations are relative to the WT encoding
+        if wt_seq != self.wt_seq:
+            self.encode_cache.clear()
+        self.wt_seq = wt_seq
         tokens = self.compose_input([('protein', wt_seq)])
         with torch.no_grad():
             encoded = self.encoder(tokens, set([self.esm_num_layers])) 
             encoded = encoded["representations"][self.esm_num_layers]
-            encoded = encoded[:, 0]
+            encoded = encoded[:, 0].float()
             self.wt_encoded = encoded
             
             padding_mask = tokens.eq(self.lm.padding_idx)  # B, T
@@ -80,19 +253,55 @@ class VED(nn.Module):
 
     def encode(self, input):
         if isinstance(input, str):
-            tokens = self.compose_input([('protein', input)])
+            return self.encode_many([input])
         elif isinstance(input, list):
-            tokens = self.compose_input([('protein', seq) for seq in input])
-        else:
-            tokens = input
-            
+            return self.encode_many(input)
+        if self.student != None:
+            return self.student(tokens_to_idx(input))
+        return self.reduce(self._encode_tokens(input))
+
+    def _encode_tokens(self, tokens):
         with torch.no_grad():
             output = self.encoder(tokens, set([self.esm_num_layers])) 
         x = output["representations"][self.esm_num_layers]
-        x = x[:, 0]
-        x = x - self.wt_encoded
-        x = self.reduce(x)
-        return x
+        x = x[:, 0].float()
+        return x - self.wt_encoded
+
+    def encode_many(self, seqs, batch_size=32):
+        """
+        (N, reduce_dim) latent states of N sequences.
+        The frozen encoder only runs on sequences missing from the cache, `batch_size` at a time.
+        """
+        if self.student != None:
+            return self.student(torch.as_tensor(seqs_to_idx(seqs), device=next(self.student.parameters()).device))
+        keys = [hashlib.blake2b(seq.encode('ascii'), digest_size=16).digest() for seq in seqs]
+        missing = {}
+        for key, seq in zip(keys, seqs):
+            if key in self.encode_cache:
+                self.encode_cache.move_to_end(key)
+                self.encode_hits += 1
+            elif key not in missing:
+                missing[key] = seq
+                self.encode_misses += 1
+        found = {key: self.encode_cache[key] for key in keys if key in self.encode_cache}
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), batch_size):
+            batch = missing_keys[start:start + batch_size]
+            encoded = self._encode_tokens(self.compose_input([('protein', missing[key]) for key in batch]))
+            for key, x in zip(batch, encoded):
+                found[key] = self.encode_cache[key] = x
+        while len(self.encode_cache) > self.encode_cache_size:
+            self.encode_cache.popitem(last=False)
+        return self.reduce(torch.stack([found[key] for key in keys]))
+
+    def encode_stats(self):
+        lookups = self.encode_hits + self.encode_misses
+        return {
+            'hits': self.encode_hits,
+            'misses': self.encode_misses,
+            'hit_rate': self.encode_hits / lookups if lookups else 0.0,
+            'cached': len(self.encode_cache),
+        }
 
     def decode(self, repr, to_seq=False, template=None, topk=None):
         sos = self.rep_recover(repr)
@@ -108,18 +317,32 @@ class VED(nn.Module):
         x = x.transpose(0, 1)
         logits = self.lm.lm_head(x)
         if to_seq: # constrained decoding
-            tokens = torch.argmax(logits[:,1:-1,4:24], dim=-1)  
-            if topk != None: 
-                indices = torch.topk(torch.max(logits[:,1:-1,4:24], dim=-1).values, topk).indices
-                indices = indices.flatten().tolist()
-                sequences = [''.join([self.alphabet.all_toks[i+4] if i in indices else t for t, i in zip(list(template),sequence.tolist())]) for sequence in list(tokens)]
-            else:
-                sequences = [''.join([self.alphabet.all_toks[i+4] for i in sequence.tolist()]) for sequence in list(tokens)]
+            sequences = idx_to_seqs(self.logits_to_idx(logits, template, topk))
             if len(sequences) == 1:                
                 sequences = sequences[0]
             return sequences
         return logits
 
+    def logits_to_idx(self, logits, template=None, topk=None):
+        """
+        (N, L) uint8 codec indices of the decoded sequences.
+        With topk, each row keeps the template except at its topk most confident positions.
+        """
+        aa_logits = logits[:, 1:-1, AA_OFFSET:AA_OFFSET + N_AA_TOKENS]
+        confidence, tokens = aa_logits.max(dim=-1)
+        idx = torch.as_tensor(AA_TOKEN_TO_IDX, device=tokens.device)[tokens]
+        if topk is not None:
+            template = torch.as_tensor(seqs_to_idx(template), device=tokens.device)
+            keep = torch.zeros_like(confidence, dtype=torch.bool)
+            keep.scatter_(1, confidence.topk(topk, dim=-1).indices, True)
+            idx = torch.where(keep, idx, template)
+        return idx
+
+    def decode_many(self, repr, template=None, topk=None):
+        """Constrained decoding of every row of `repr`, always a list of N sequences."""
+        with torch.no_grad():
+            return idx_to_seqs(self.logits_to_idx(self.decode(repr), template, topk))
+
     def forward(self, input, return_rep=False):
         repr = self.encode(input)
         logits = self.decode(repr)
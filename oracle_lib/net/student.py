@@ -0,0 +1,52 @@
+'''
+Small student encoders distilled from the VED latent encoder (see distill_encoder.py).
+A student maps residue indices straight to the latent reduce(CLS - CLS(WT)) of one (protein, level),
+so VED.encode can skip the 650M-parameter ESM-2 forward.
+'''
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from oracle_lib.net.rew import MaskedConv1d
+
+
+class StudentCNN(nn.Module):
+    """ Two same-padded convolutions over the one-hot sequence, mean and max pooled, then an MLP head.
+
+         Shape:
+            Input: (N, L) residue indices
+            Output: (N, reduce_dim) latent in [-1, 1], as the teacher's Tanh
+    """
+
+    def __init__(self, reduce_dim: int, n_tokens: int = 20, kernel_size: int = 5, hidden_size: int = 256):
+        super().__init__()
+        self.n_tokens = n_tokens
+        self.conv1 = MaskedConv1d(n_tokens, hidden_size, kernel_size)
+        self.conv2 = MaskedConv1d(hidden_size, hidden_size, kernel_size)
+        self.head = nn.Sequential(
+            nn.Linear(hidden_size * 2, hidden_size),
+            nn.ReLU(),
+            nn.Linear(hidden_size, reduce_dim),
+            nn.Tanh()
+        )
+
+    def forward(self, x):
+        x = F.one_hot(x.long(), num_classes=self.n_tokens).float()
+        x = F.relu(self.conv1(x))
+        x = F.relu(self.conv2(x))
+        x = torch.cat([x.mean(dim=1), x.max(dim=1)[0]], dim=-1)
+        return self.head(x)
+
+
+def save_student(path: str, student: StudentCNN, wt: str, **config):
+    """ `config` holds the StudentCNN constructor arguments, `wt` the WT sequence its latents are relative to. """
+    torch.save({'state_dict': student.state_dict(), 'config': config, 'wt': wt}, path)
+
+
+def load_student(path: str, device):
+    """ (StudentCNN, WT sequence) from a save_student checkpoint. """
+    ckpt = torch.load(path, map_location=device)
+    student = StudentCNN(**ckpt['config'])
+    student.load_state_dict(ckpt['state_dict'])
+    student.eval()
+    student.requires_grad_(False)
+    return student.to(device), ckpt['wt']
@@ -0,0 +1,107 @@
+'''
+Start-up time and memory of VED loading variants, each measured in a fresh process.
+    legacy     random init + full torch.load of the ESM-2 and VED checkpoints (config_rep default, lean_load = False)
+    lean       memory-mapped checkpoints, no random init, encoder/lm modules shared when bit-identical
+    lean_bf16  lean with the frozen encoder stored in bf16
+    lean_int8  lean with the frozen encoder dynamically quantized to int8 (CPU)
+Anonymous RSS is private to the env process; file-backed RSS are page-cache pages of the memory-mapped
+checkpoint that every env on the host shares.
+Each variant also encodes and decodes the wild type and a few of its point mutants; "match" is the fraction of
+decoded residues equal to legacy, "max dz" the largest latent difference. lean_load stays off in config_rep
+until the lean variants match legacy on the real checkpoints.
+
+python report_ved_memory.py --protein GFP --level hard
+'''
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+VARIANTS = {
+    'legacy': dict(lean_load=False, encoder_dtype=None),
+    'lean': dict(lean_load=True, encoder_dtype=None),
+    'lean_bf16': dict(lean_load=True, encoder_dtype='bf16'),
+    'lean_int8': dict(lean_load=True, encoder_dtype='int8'),
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--protein', type=str, choices=['GFP', 'AAV'], required=True)
+parser.add_argument('--level', type=str, default='hard')
+parser.add_argument('--device', type=str, default='cpu')
+parser.add_argument('--variants', type=str, nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+parser.add_argument('--variant', type=str, choices=list(VARIANTS), default=None, help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+def proc_status():
+    status = {}
+    with open('/proc/self/status') as file:
+        for line in file:
+            key, _, value = line.partition(':')
+            if key in ('RssAnon', 'RssFile'):
+                status[key] = int(value.split()[0]) * 1024
+    return status
+
+
+def measure(variant):
+    import torch
+    from config import config_rep
+    from net.seq_lm import VED
+    from utils.constants import REFSEQ
+    cfg = config_rep(args.device, args.protein, args.level)
+    for k, v in VARIANTS[variant].items():
+        setattr(cfg, k, v)
+    start = time.time()
+    model = VED(cfg, pretrained=f'saved/{args.protein}_{args.level}_LM.pt').to(args.device)
+    load_seconds = time.time() - start
+    wt = REFSEQ[args.protein][args.level]
+    model.set_wt_tokens(wt)
+    start = time.time()
+    with torch.no_grad():
+        model.encode(wt)
+    first_encode_seconds = time.time() - start
+    probes = [wt] + [wt[:i] + ('A' if wt[i] != 'A' else 'G') + wt[i + 1:] for i in range(0, len(wt), max(1, len(wt) // 7))]
+    with torch.no_grad():
+        latent = model.encode_many(probes).float()
+        decoded = model.decode_many(latent)
+    return {
+        'variant': variant,
+        'load_seconds': load_seconds,
+        'first_encode_seconds': first_encode_seconds,
+        'latent': latent.cpu().tolist(),
+        'decoded': decoded,
+        'shared_modules': model.n_shared,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        **{f'{k}_bytes': v for k, v in proc_status().items()},
+    }
+
+
+def main():
+    if args.variant is not None:
+        print(json.dumps(measure(args.variant)))
+        return
+    rows = []
+    for variant in args.variants:
+        cmd = [sys.executable, __file__, '--protein', args.protein, '--level', args.level, '--device', args.device, '--variant', variant]
+        out = subprocess.run(cmd, capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f'{variant}: failed\n{out.stderr}')
+            continue
+        rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    gb = 1024 ** 3
+    ref = next((r for r in rows if r['variant'] == 'legacy'), None)
+    print(f"{'variant':<10} {'load s':>8} {'encode s':>9} {'shared':>7} {'peak RSS GB':>12} {'anon GB':>8} {'file GB':>8} {'match':>7} {'max dz':>8}")
+    for r in rows:
+        match = max_dz = float('nan')
+        if ref is not None:
+            pairs = [(a, b) for x, y in zip(r['decoded'], ref['decoded']) for a, b in zip(x, y)]
+            match = sum(a == b for a, b in pairs) / len(pairs)
+            max_dz = max(abs(a - b) for x, y in zip(r['latent'], ref['latent']) for a, b in zip(x, y))
+        print(f"{r['variant']:<10} {r['load_seconds']:>8.2f} {r['first_encode_seconds']:>9.3f} {r['shared_modules']:>7} "
+              f"{r['peak_rss_bytes'] / gb:>12.2f} {r.get('RssAnon_bytes', 0) / gb:>8.2f} {r.get('RssFile_bytes', 0) / gb:>8.2f} "
+              f"{match:>7.4f} {max_dz:>8.2e}")
+
+if __name__ == '__main__':
+    main()
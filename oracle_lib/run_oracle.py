@@ -24,10 +24,7 @@ def main():
   starting_sequences['true_score'] = (starting_sequences['true_score'] - min_fitness)/(max_fitness - min_fitness)
 
   oracle = Model(epochs=10, device=args.device)
-  oracle_ckpt = torch.load(f'ckpt/{protein}/oracle.ckpt', map_location=args.device)
-  if "state_dict" in oracle_ckpt.keys():
-      oracle_ckpt = oracle_ckpt["state_dict"]
-  oracle.model.load_state_dict({ k.replace('predictor.',''):v for k,v in oracle_ckpt.items() })
+  oracle.load(f'ckpt/{protein}/oracle.ckpt')
   
   starting_sequences['oracle_score'] = oracle.get_fitness(starting_sequences['sequence'].values)
   starting_sequences['oracle_score'] = (starting_sequences['oracle_score'] - min_fitness)/(max_fitness - min_fitness)
@@ -0,0 +1,197 @@
+'''
+Local oracle scoring daemon.
+Loads each requested oracle once and coalesces concurrent requests from many clients
+into batched forwards. A batch is flushed when `max_batch` sequences are queued or the
+oldest queued request has waited `max_latency_ms`. See utils/oracle_client.py for the protocol.
+
+PYTHONPATH=.. python serve_oracle.py --socket /tmp/oracle.sock --preload GFP/oracle.ckpt
+'''
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+import torch
+from oracle_lib.net.rew import load_oracle, predict_fitness
+from oracle_lib.utils.codec import N_TOKENS
+from oracle_lib.utils.oracle_client import OP_FITNESS, OP_STATS, STATUS_OK, STATUS_ERROR, REQUEST_HEADER, recv_exact, send_response
+
+
+class Batcher:
+    """Queues requests for one oracle and scores them in micro-batches on a worker thread."""
+    def __init__(self, model, max_batch: int, max_latency: float, window: int = 10000):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.length = None
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.sequences = 0
+        self.batches = 0
+        self.batch_sizes = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, idx: np.ndarray) -> Future:
+        if self.length is None:
+            self.length = idx.shape[1]
+        if idx.shape[1] != self.length:
+            raise ValueError(f'expected sequences of length {self.length}, got {idx.shape[1]}')
+        if idx.size and idx.max() >= N_TOKENS:
+            raise ValueError('residue indices out of range')
+        future = Future()
+        self.queue.put((time.perf_counter(), idx, future))
+        return future
+
+    def run(self):
+        while True:
+            pending = [self.queue.get()]
+            size = pending[0][1].shape[0]
+            deadline = pending[0][0] + self.max_latency
+            while size < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += item[1].shape[0]
+            self.score(pending)
+
+    def score(self, pending):
+        try:
+            scores = predict_fitness(self.model, np.concatenate([idx for _, idx, _ in pending]))
+        except Exception as e:
+            for _, _, future in pending:
+                future.set_exception(e)
+            return
+        done = time.perf_counter()
+        start = 0
+        for _, idx, future in pending:
+            future.set_result(scores[start:start + idx.shape[0]])
+            start += idx.shape[0]
+        with self.lock:
+            self.requests += len(pending)
+            self.sequences += start
+            self.batches += 1
+            self.batch_sizes.append(start)
+            self.latencies.extend(done - arrived for arrived, _, _ in pending)
+
+    def stats(self) -> dict:
+        with self.lock:
+            sizes = np.array(self.batch_sizes, dtype=np.float64)
+            latencies = np.array(self.latencies, dtype=np.float64) * 1000
+            stats = {
+                'queue_depth': self.queue.qsize(),
+                'requests': self.requests,
+                'sequences': self.sequences,
+                'batches': self.batches,
+            }
+        if len(sizes):
+            stats.update({
+                'batch_size_mean': float(sizes.mean()),
+                'batch_size_p50': float(np.percentile(sizes, 50)),
+                'batch_size_max': float(sizes.max()),
+                'latency_ms_p50': float(np.percentile(latencies, 50)),
+                'latency_ms_p90': float(np.percentile(latencies, 90)),
+                'latency_ms_p99': float(np.percentile(latencies, 99)),
+                'latency_ms_max': float(latencies.max()),
+            })
+        return stats
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                op, key_len, n, length = REQUEST_HEADER.unpack(recv_exact(self.request, REQUEST_HEADER.size))
+                key = recv_exact(self.request, key_len).decode('utf-8')
+                idx = np.frombuffer(recv_exact(self.request, n * length), dtype=np.uint8).reshape(n, length)
+            except ConnectionError:
+                return
+            try:
+                if op == OP_FITNESS:
+                    scores = self.server.get_batcher(key).submit(idx).result()
+                    payload = scores.astype('>f8').tobytes()
+                elif op == OP_STATS:
+                    payload = json.dumps(self.server.stats()).encode('utf-8')
+                else:
+                    raise ValueError(f'unknown op {op!r}')
+            except Exception as e:
+                send_response(self.request, STATUS_ERROR, str(e).encode('utf-8'))
+                continue
+            send_response(self.request, STATUS_OK, payload)
+
+
+class OracleServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, ckpt_dir, device, max_batch, max_latency):
+        self.ckpt_dir = os.path.abspath(ckpt_dir)
+        self.device = device
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.batchers = {}
+        self.batchers_lock = threading.Lock()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, RequestHandler)
+
+    def get_batcher(self, key: str) -> Batcher:
+        with self.batchers_lock:
+            if key not in self.batchers:
+                path = os.path.abspath(os.path.join(self.ckpt_dir, key))
+                if os.path.commonpath([path, self.ckpt_dir]) != self.ckpt_dir or not os.path.isfile(path):
+                    raise ValueError(f'unknown oracle {key}')
+                self.batchers[key] = Batcher(load_oracle(path, self.device), self.max_batch, self.max_latency)
+                print(f'loaded {key}')
+            return self.batchers[key]
+
+    def stats(self) -> dict:
+        with self.batchers_lock:
+            batchers = dict(self.batchers)
+        return {key: batcher.stats() for key, batcher in batchers.items()}
+
+
+def log_stats(server, interval):
+    while True:
+        time.sleep(interval)
+        print(json.dumps(server.stats()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', type=str, default='/tmp/oracle.sock')
+    parser.add_argument('--ckpt_dir', type=str, default='ckpt')
+    parser.add_argument('--device', type=str, choices=['cpu', 'cuda'], default='cpu')
+    parser.add_argument('--max_batch', type=int, default=512, help='sequences per forward')
+    parser.add_argument('--max_latency_ms', type=float, default=2.0, help='longest a request waits for a batch to fill')
+    parser.add_argument('--preload', type=str, nargs='*', default=[], help='oracles to load at startup, e.g. GFP/oracle.ckpt')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('--log_interval', type=float, default=60, help='seconds between stats logs, 0 disables')
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    server = OracleServer(args.socket, args.ckpt_dir, args.device, args.max_batch, args.max_latency_ms / 1000)
+    for key in args.preload:
+        server.get_batcher(key)
+    if args.log_interval > 0:
+        threading.Thread(target=log_stats, args=(server, args.log_interval), daemon=True).start()
+    print(f'serving on {args.socket}')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+if __name__ == '__main__':
+    main()
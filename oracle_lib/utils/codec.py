@@ -0,0 +1,92 @@
+'''
+Batch codec between amino acid strings and index matrices.
+Sequences are converted through 256-entry byte lookup tables instead of per-character dict lookups.
+'''
+import numpy as np
+import torch
+import torch.nn.functional as F
+from typing import List, Sequence, Union
+
+AAS = 'ARNDCQEGHILKMFPSTWYV'
+N_TOKENS = len(AAS)
+UNK_IDX = 255
+
+# byte -> index, unknown bytes map to UNK_IDX
+ENCODE_LUT = np.full(256, UNK_IDX, dtype=np.uint8)
+ENCODE_LUT[np.frombuffer(AAS.encode('ascii'), dtype=np.uint8)] = np.arange(N_TOKENS, dtype=np.uint8)
+# index -> byte
+DECODE_LUT = np.frombuffer(AAS.encode('ascii'), dtype=np.uint8).copy()
+
+
+def seqs_to_idx(seqs: Union[str, Sequence[str]]) -> np.ndarray:
+    """
+    input: list of N amino acid sequences of equal length L
+    output: (N, L) uint8 index matrix
+    """
+    if isinstance(seqs, str):
+        seqs = [seqs]
+    seqs = list(seqs)
+    if len(seqs) == 0:
+        return np.zeros((0, 0), dtype=np.uint8)
+    length = len(seqs[0])
+    if any(len(s) != length for s in seqs):
+        raise ValueError('All sequences must have the same length')
+    try:
+        buf = ''.join(seqs).encode('ascii')
+    except UnicodeEncodeError as e:
+        raise ValueError('Sequences contain non amino acid characters') from e
+    idx = ENCODE_LUT[np.frombuffer(buf, dtype=np.uint8)]
+    if (idx == UNK_IDX).any():
+        raise ValueError('Sequences contain non amino acid characters')
+    return idx.reshape(len(seqs), length)
+
+
+def as_idx(seqs) -> Union[np.ndarray, torch.Tensor]:
+    """
+    Pass pre-encoded (N, L) integer index matrices through, encode sequences otherwise.
+    """
+    if isinstance(seqs, torch.Tensor) and not seqs.is_floating_point():
+        return seqs
+    if isinstance(seqs, np.ndarray) and np.issubdtype(seqs.dtype, np.integer):
+        return seqs
+    return seqs_to_idx(seqs)
+
+
+def idx_to_seqs(idx: Union[np.ndarray, torch.Tensor]) -> List[str]:
+    """
+    input: (N, L) or (L,) index matrix
+    output: list of N amino acid sequences
+    """
+    if isinstance(idx, torch.Tensor):
+        idx = idx.detach().cpu().numpy()
+    idx = np.asarray(idx)
+    if idx.ndim == 1:
+        idx = idx[None]
+    if idx.shape[0] == 0:
+        return []
+    if idx.shape[1] == 0:
+        return [''] * idx.shape[0]
+    if idx.min() < 0 or idx.max() >= N_TOKENS:
+        raise ValueError(f'Indices must be in [0, {N_TOKENS})')
+    chars = np.ascontiguousarray(DECODE_LUT[idx])
+    return chars.view(f'S{idx.shape[1]}')[:, 0].astype(f'U{idx.shape[1]}').tolist()
+
+
+def idx_to_one_hot(idx: Union[np.ndarray, torch.Tensor], device=None) -> torch.Tensor:
+    """
+    input: (..., L) index matrix
+    output: (..., L, 20) one-hot tensor on `device`
+    """
+    if isinstance(idx, np.ndarray):
+        idx = torch.from_numpy(idx)
+    return F.one_hot(idx.to(device=device, dtype=torch.long), N_TOKENS)
+
+
+def one_hot_to_idx(t: Union[np.ndarray, torch.Tensor]) -> np.ndarray:
+    """
+    input: (..., L, 20) one-hot (or score) tensor
+    output: (..., L) uint8 index matrix of the argmax residues
+    """
+    if isinstance(t, torch.Tensor):
+        t = t.detach().cpu().numpy()
+    return np.argmax(t, axis=-1).astype(np.uint8)
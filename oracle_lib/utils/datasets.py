@@ -3,6 +3,7 @@ import numpy as np
 import torch
 from torch.utils.data import Dataset
 from utils.constants import seq_to_one_hot
+from utils.esm_tokens import ESM_TOKENS, encode_tokens, mutation_mask
 from typing import List, Tuple, Sequence, Any
 
 def pad_sequences(sequences: Sequence, pad_len, constant_value=0, dtype=None) -> np.ndarray:
@@ -27,18 +28,14 @@ class SequenceDataset(Dataset):
     def __init__(self, data, wt, alphabet, in_memory: bool = False):
         self.data = data
         self.wt = wt
-        self.batch_converter = alphabet.get_batch_converter()
+        assert tuple(alphabet.all_toks) == ESM_TOKENS, 'alphabet differs from the ESM-1b token set'
 
     def __len__(self) -> int:
         return len(self.data)
 
     def __getitem__(self, index: int):
-        sequence = self.data[index]
-        mask = [1 if i!=j else 0 for i,j in zip(list(sequence), list(self.wt))]
-        mask = [0] + mask + [0]
-        return sequence, torch.tensor(mask)
-
-    def collate_fn(self, batch: List[Tuple[Any, ...]]):
-        input_ids, mut_masks = tuple(zip(*batch))
-        _, _, batch_tokens = self.batch_converter(list(zip(["protein" for _ in range(len(input_ids))], input_ids)))
-        return batch_tokens, torch.stack(mut_masks, dim=0)
\ No newline at end of file
+        return self.data[index]
+
+    def collate_fn(self, batch: List[str]):
+        # tokens and WT-diff masks (0 at <cls>/<eos>) for the whole batch at once
+        return encode_tokens(batch), mutation_mask(batch, self.wt)
\ No newline at end of file
@@ -0,0 +1,87 @@
+'''
+Direct token-id encoder for ESM models.
+ESM-1b/ESM-2 (fair-esm Alphabet.from_architecture("ESM-1b") and the HuggingFace EsmTokenizer) share one
+fixed 33-token vocabulary. Sequences are encoded through a 256-entry byte lookup table into padded
+<cls> seq <eos> <pad>... token matrices, without a tokenizer call or batch_converter per batch.
+'''
+import numpy as np
+import torch
+from typing import Sequence, Union
+from .codec import ENCODE_LUT
+
+ESM_TOKENS = (
+    '<cls>', '<pad>', '<eos>', '<unk>',
+    'L', 'A', 'G', 'V', 'S', 'E', 'R', 'T', 'I', 'D', 'P', 'K', 'Q', 'N', 'F', 'Y', 'M', 'H', 'W', 'C',
+    'X', 'B', 'U', 'Z', 'O', '.', '-', '<null_1>', '<mask>',
+)
+CLS_IDX, PAD_IDX, EOS_IDX, UNK_IDX = 0, 1, 2, 3
+MASK_IDX = ESM_TOKENS.index('<mask>')
+
+# byte -> token id, every single-character token maps to itself, any other byte to <unk>
+TOKEN_LUT = np.full(256, UNK_IDX, dtype=np.int64)
+for _idx, _tok in enumerate(ESM_TOKENS):
+    if len(_tok) == 1:
+        TOKEN_LUT[ord(_tok)] = _idx
+
+# the 20 amino acid tokens are contiguous, AA_TOKEN_TO_IDX[t - AA_OFFSET] is the codec index of token t
+AA_OFFSET, N_AA_TOKENS = 4, 20
+AA_TOKEN_TO_IDX = ENCODE_LUT[[ord(tok) for tok in ESM_TOKENS[AA_OFFSET:AA_OFFSET + N_AA_TOKENS]]]
+
+
+def tokens_to_idx(tokens: torch.Tensor) -> torch.Tensor:
+    """
+    (N, L + 2) amino acid token ids with <cls>/<eos> -> (N, L) uint8 codec indices.
+    Raises ValueError if a residue is not one of the 20 amino acids (e.g. <unk>, X or padding).
+    """
+    aa = tokens[:, 1:-1] - AA_OFFSET
+    invalid = (aa < 0) | (aa >= N_AA_TOKENS)
+    if invalid.any():
+        bad = sorted({ESM_TOKENS[t] for t in tokens[:, 1:-1][invalid].unique().tolist() if 0 <= t < len(ESM_TOKENS)})
+        raise ValueError(f'expected amino acid tokens only, got {bad or "ids outside the vocabulary"}')
+    lut = torch.as_tensor(AA_TOKEN_TO_IDX, device=tokens.device)
+    return lut[aa]
+
+
+def token_ids(tokens: Sequence[str]) -> torch.Tensor:
+    """Token ids of single-character tokens, e.g. ALPHABET -> ids of the 20 amino acids in that order."""
+    return torch.from_numpy(TOKEN_LUT[np.frombuffer(''.join(tokens).encode('ascii'), dtype=np.uint8)])
+
+
+def encode_tokens(seqs: Union[str, Sequence[str]]) -> torch.Tensor:
+    """
+    input: N sequences, lengths may differ
+    output: (N, max_len + 2) int64 token ids, <cls> seq <eos> then <pad>, as batch_converter and EsmTokenizer
+    """
+    if isinstance(seqs, str):
+        seqs = [seqs]
+    seqs = list(seqs)
+    lengths = np.fromiter((len(s) for s in seqs), dtype=np.int64, count=len(seqs))
+    width = int(lengths.max()) + 2 if len(seqs) else 2
+    tokens = np.full((len(seqs), width), PAD_IDX, dtype=np.int64)
+    if len(seqs) == 0:
+        return torch.from_numpy(tokens)
+    # non-ascii characters become '?' and therefore <unk>, one byte per character keeps offsets aligned
+    ids = TOKEN_LUT[np.frombuffer(''.join(seqs).encode('ascii', errors='replace'), dtype=np.uint8)]
+    rows = np.repeat(np.arange(len(seqs)), lengths)
+    cols = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + 1
+    tokens[rows, cols] = ids
+    tokens[:, 0] = CLS_IDX
+    tokens[np.arange(len(seqs)), lengths + 1] = EOS_IDX
+    return torch.from_numpy(tokens)
+
+
+def mutation_mask(seqs: Union[str, Sequence[str]], wt: str) -> torch.Tensor:
+    """
+    input: N sequences of the wild-type length
+    output: (N, L + 2) int64, 1 where a residue differs from `wt`, 0 elsewhere and at <cls>/<eos>
+    """
+    if isinstance(seqs, str):
+        seqs = [seqs]
+    seqs = list(seqs)
+    if any(len(s) != len(wt) for s in seqs):
+        raise ValueError(f'expected sequences of length {len(wt)}')
+    mask = np.zeros((len(seqs), len(wt) + 2), dtype=np.int64)
+    if seqs:
+        buf = np.frombuffer(''.join(seqs).encode('ascii', errors='replace'), dtype=np.uint8).reshape(len(seqs), -1)
+        mask[:, 1:-1] = buf != np.frombuffer(wt.encode('ascii'), dtype=np.uint8)
+    return torch.from_numpy(mask)
@@ -1,16 +1,80 @@
-import itertools
+import numpy as np
+from .codec import N_TOKENS, as_idx
 
 def distance(s1, s2):
     return sum([1 if i!=j else 0 for i,j in zip(list(s1), list(s2))])
 
 def diversity(seqs):
-    divs = []
-    for s1, s2 in itertools.combinations(seqs, 2):
-        divs.append(distance(s1, s2))
-    return sum(divs) / len(divs)
+    hist = pairwise_hamming_hist(seqs)
+    return (hist * np.arange(len(hist))).sum() / hist.sum()
 
 def mean_distance(seq, seqs):
     divs = []
     for s in seqs:
         divs.append(distance(seq, s))
-    return sum(divs) / len(divs)
\ No newline at end of file
+    return sum(divs) / len(divs)
+
+'''
+Blocked Hamming kernels over (N, L) index matrices.
+Distances are computed as L - onehot(a) @ onehot(b).T, exact in float32 for L < 2**24, and only
+`block_size` rows of each side are expanded at a time so memory stays bounded for large N.
+'''
+
+def _to_idx(seqs) -> np.ndarray:
+    idx = as_idx(seqs)
+    if not isinstance(idx, np.ndarray):
+        idx = idx.cpu().numpy()
+    return idx
+
+def _one_hot(idx: np.ndarray) -> np.ndarray:
+    return np.eye(N_TOKENS, dtype=np.float32)[idx].reshape(len(idx), -1)
+
+def hamming_blocks(a, b=None, block_size: int = 1024):
+    """
+    Yield (i, j, D) where D is the int32 Hamming distance block a[i:i+bs] x b[j:j+bs].
+    With b=None, distances within a, only blocks on or above the diagonal (j >= i).
+    """
+    symmetric = b is None
+    a = _to_idx(a)
+    b = a if symmetric else _to_idx(b)
+    length = a.shape[1]
+    for i in range(0, len(a), block_size):
+        a_blk = _one_hot(a[i:i + block_size])
+        for j in range(i if symmetric else 0, len(b), block_size):
+            b_blk = a_blk if symmetric and j == i else _one_hot(b[j:j + block_size])
+            yield i, j, length - (a_blk @ b_blk.T).astype(np.int32)
+
+def pairwise_hamming_hist(seqs, block_size: int = 1024) -> np.ndarray:
+    """(L+1,) counts of Hamming distances over all pairs i < j."""
+    idx = _to_idx(seqs)
+    hist = np.zeros(idx.shape[1] + 1, dtype=np.int64)
+    for i, j, d in hamming_blocks(idx, block_size=block_size):
+        if i == j:
+            d = d[np.triu_indices(len(d), k=1)]
+        hist += np.bincount(d.ravel(), minlength=len(hist))
+    return hist
+
+def min_hamming(seqs, refs, block_size: int = 1024) -> np.ndarray:
+    """(N,) Hamming distance from each sequence to its nearest reference."""
+    idx = _to_idx(seqs)
+    nearest = np.full(len(idx), idx.shape[1] + 1, dtype=np.int64)
+    for i, _, d in hamming_blocks(idx, refs, block_size):
+        np.minimum(nearest[i:i + len(d)], d.min(axis=1), out=nearest[i:i + len(d)])
+    return nearest
+
+def hist_median(hist: np.ndarray) -> float:
+    """np.median of the values counted in `hist`."""
+    n = hist.sum()
+    if n == 0:
+        return np.nan
+    cdf = np.cumsum(hist)
+    lo = np.searchsorted(cdf, (n - 1) // 2, side='right')
+    hi = np.searchsorted(cdf, n // 2, side='right')
+    return (lo + hi) / 2
+
+def hist_quantile(hist: np.ndarray, q: float) -> float:
+    """Lower q-quantile of the values counted in `hist`."""
+    n = hist.sum()
+    if n == 0:
+        return np.nan
+    return float(np.searchsorted(np.cumsum(hist), int(q * (n - 1)), side='right'))
@@ -0,0 +1,105 @@
+'''
+Client for the local oracle scoring daemon (serve_oracle.py).
+
+Protocol over a Unix stream socket, integers big-endian:
+    request:  op (1 byte) | key length (uint16) | n (uint32) | L (uint32) | key | n*L uint8 residue indices
+    response: status (1 byte) | payload length (uint32) | payload
+op b'F' scores n sequences with the oracle `key` (payload: n float64 raw scores),
+op b'S' returns server statistics (payload: JSON).
+status b'O' is success, b'E' an error (payload: utf-8 message).
+'''
+import json
+import socket
+import struct
+import threading
+import numpy as np
+from typing import List
+from .codec import N_TOKENS, as_idx
+
+OP_FITNESS = b'F'
+OP_STATS = b'S'
+STATUS_OK = b'O'
+STATUS_ERROR = b'E'
+REQUEST_HEADER = struct.Struct('!cHII')
+RESPONSE_HEADER = struct.Struct('!cI')
+
+
+def recv_exact(sock, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while size > 0:
+        n = sock.recv_into(view, size)
+        if n == 0:
+            raise ConnectionError('oracle server closed the connection')
+        view = view[n:]
+        size -= n
+    return bytes(buf)
+
+
+def send_response(sock, status: bytes, payload: bytes):
+    sock.sendall(RESPONSE_HEADER.pack(status, len(payload)) + payload)
+
+
+class OracleClient:
+    """
+    Drop-in for insilico.Model backed by the scoring daemon.
+    socket_path: Unix socket of serve_oracle.py
+    key: checkpoint relative to the server's ckpt dir, e.g. 'GFP/oracle.ckpt'
+    """
+    def __init__(self, socket_path: str, key: str):
+        self.socket_path = socket_path
+        self.key = key.encode('utf-8')
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(self.socket_path)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _request(self, op: bytes, idx: np.ndarray) -> bytes:
+        with self.lock:
+            self.connect()
+            try:
+                self.sock.sendall(REQUEST_HEADER.pack(op, len(self.key), idx.shape[0], idx.shape[1]) + self.key + idx.tobytes())
+                status, size = RESPONSE_HEADER.unpack(recv_exact(self.sock, RESPONSE_HEADER.size))
+                payload = recv_exact(self.sock, size)
+            except (ConnectionError, OSError):
+                self.close()
+                raise
+        if status != STATUS_OK:
+            raise RuntimeError(f'oracle server error: {payload.decode("utf-8")}')
+        return payload
+
+    def get_fitness(self, sequences: List[str]) -> np.ndarray:
+        """Accepts sequences or a pre-encoded (N, L) index matrix."""
+        idx = as_idx(sequences)
+        if not isinstance(idx, np.ndarray):
+            idx = idx.cpu().numpy()
+        idx = np.ascontiguousarray(idx, dtype=np.uint8)
+        if idx.shape[0] == 0:
+            return np.zeros(0, dtype=np.float64)
+        return np.frombuffer(self._request(OP_FITNESS, idx), dtype='>f8').astype(np.float64)
+
+    # the server always runs full forwards, parents are not cached remotely
+    def set_parents(self, parents: List[str]) -> np.ndarray:
+        return self.get_fitness(parents)
+
+    def get_child_fitness(self, children: List[str], parent_ids=None, update=False) -> np.ndarray:
+        return self.get_fitness(children)
+
+    def scan(self, sequence: str, chunk_size: int = None) -> np.ndarray:
+        """(L, 20) fitness of every single-site substitution of `sequence`, sent as one request."""
+        parent = as_idx([sequence])[0]
+        length = parent.shape[0]
+        variants = np.repeat(parent[None], length * N_TOKENS, axis=0)
+        variants[np.arange(length * N_TOKENS), np.arange(length * N_TOKENS) // N_TOKENS] = np.tile(np.arange(N_TOKENS, dtype=np.uint8), length)
+        return self.get_fitness(variants).reshape(length, N_TOKENS)
+
+    def stats(self) -> dict:
+        return json.loads(self._request(OP_STATS, np.zeros((0, 0), dtype=np.uint8)).decode('utf-8'))
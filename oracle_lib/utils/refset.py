@@ -0,0 +1,106 @@
+'''
+Binary cache of a reference CSV (sequence, target) for fast evaluator start-up.
+
+build_refset writes next to data/{protein}/all.csv a directory all.refset/ holding
+    sequences.npy   (N, L) uint8 residue indices
+    targets.npy     (N,) float32 targets
+    above_q{q}.npy  row ids with target strictly above the q-quantile, in CSV order
+    above_q{q}.index.npz  HammingIndex over those rows, only written when there are any
+    meta.json       written last, records the CSV size and mtime the cache was built from
+load_refset memory-maps the arrays and rebuilds the cache when the CSV's size or mtime changed.
+'''
+import json
+import os
+import numpy as np
+import pandas as pd
+from .codec import seqs_to_idx
+from .hamming_index import HammingIndex
+
+QUANTILES = (0.9,)
+
+
+def refset_dir(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + '.refset'
+
+
+def _csv_stamp(csv_path: str) -> dict:
+    stat = os.stat(csv_path)
+    return {'csv_size': stat.st_size, 'csv_mtime_ns': stat.st_mtime_ns}
+
+
+def _index_name(q: float) -> str:
+    return f'above_q{q}.index.npz'
+
+
+def _save(path: str, array):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as file:
+        if isinstance(array, HammingIndex):
+            array.save(file)
+        else:
+            np.save(file, array)
+    os.replace(tmp, path)
+
+
+def build_refset(csv_path: str, quantiles=QUANTILES) -> str:
+    """Encode `csv_path` into its cache directory and return the directory."""
+    stamp = _csv_stamp(csv_path)
+    data = pd.read_csv(csv_path)[['sequence', 'target']]
+    out_dir = refset_dir(csv_path)
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    sequences = seqs_to_idx(data['sequence'].tolist())
+    _save(os.path.join(out_dir, 'sequences.npy'), sequences)
+    _save(os.path.join(out_dir, 'targets.npy'), data['target'].to_numpy(dtype=np.float32))
+    indexed = []
+    for q in quantiles:
+        # thresholds on the float64 targets, as pandas does
+        above = np.nonzero(data['target'] > data['target'].quantile(q=q).item())[0]
+        _save(os.path.join(out_dir, f'above_q{q}.npy'), above.astype(np.int64))
+        if len(above):
+            _save(os.path.join(out_dir, _index_name(q)), HammingIndex(sequences[above]))
+            indexed.append(q)
+    meta = {**stamp, 'n_sequences': len(sequences), 'length': sequences.shape[1], 'quantiles': list(quantiles),
+            'indexed_quantiles': indexed}
+    tmp = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(meta, file, indent=2)
+    os.replace(tmp, meta_path)
+    return out_dir
+
+
+class RefSet:
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as file:
+            self.meta = json.load(file)
+        self.sequences = np.load(os.path.join(path, 'sequences.npy'), mmap_mode='r')
+        self.targets = np.load(os.path.join(path, 'targets.npy'), mmap_mode='r')
+
+    def above_quantile(self, q: float) -> np.ndarray:
+        """Row ids with target strictly above the q-quantile, in CSV order."""
+        return np.load(os.path.join(self.path, f'above_q{q}.npy'))
+
+    def high_index(self, q: float) -> HammingIndex:
+        """HammingIndex over the rows above the q-quantile, as stored by build_refset."""
+        if q not in self.meta['indexed_quantiles']:
+            raise ValueError(f'no sequences above the {q}-quantile in {self.path}')
+        return HammingIndex.load(os.path.join(self.path, _index_name(q)))
+
+
+def load_refset(csv_path: str, quantiles=QUANTILES) -> RefSet:
+    """Memory-mapped cache of `csv_path`, (re)built when missing or stale."""
+    path = refset_dir(csv_path)
+    meta_path = os.path.join(path, 'meta.json')
+    try:
+        with open(meta_path) as file:
+            meta = json.load(file)
+        fresh = {k: meta.get(k) for k in ('csv_size', 'csv_mtime_ns')} == _csv_stamp(csv_path) \
+            and set(quantiles) <= set(meta['quantiles']) and 'indexed_quantiles' in meta
+    except (OSError, ValueError, KeyError):
+        fresh = False
+    if not fresh:
+        build_refset(csv_path, sorted(set(quantiles) | set(QUANTILES)))
+    return RefSet(path)
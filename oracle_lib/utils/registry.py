@@ -0,0 +1,122 @@
+'''
+Process-wide registry of loaded models.
+Envs, evaluators and scorers acquire models by (kind, checkpoint path, device, config) and share a single
+eval-mode, gradient-free instance instead of each calling torch.load. Shared models are read-only:
+anything that trains (e.g. the DoubleOpt predictor) must build its own copy.
+Import it, and the models it holds (net.rew), only as `oracle_lib.*`, so every module sees one registry
+and one set of model classes.
+'''
+import os
+import threading
+import time
+import torch
+import torch.nn as nn
+from typing import Callable, Dict, Tuple
+
+
+def module_bytes(model: nn.Module) -> int:
+    """Bytes held by the parameters and buffers of `model`, shared storages counted once."""
+    seen = set()
+    total = 0
+    for t in list(model.parameters()) + list(model.buffers()):
+        ptr = t.untyped_storage().data_ptr()
+        if ptr in seen:
+            continue
+        seen.add(ptr)
+        total += t.untyped_storage().nbytes()
+    return total
+
+
+class _Entry:
+    def __init__(self, model, load_seconds, nbytes):
+        self.model = model
+        self.load_seconds = load_seconds
+        self.nbytes = nbytes
+        self.refs = 1
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries: Dict[tuple, _Entry] = {}
+        self._keys: Dict[int, tuple] = {} # id(model) -> key
+        self._loading: Dict[tuple, threading.Event] = {} # keys whose loader is running
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.load_seconds = 0.0
+        self.saved_seconds = 0.0
+        self.saved_bytes = 0
+
+    @staticmethod
+    def key(kind: str, path: str, device, config: Tuple = ()) -> tuple:
+        return kind, os.path.realpath(path), str(torch.device(device)), tuple(config)
+
+    def acquire(self, kind: str, path: str, device, loader: Callable[[], nn.Module], config: Tuple = ()) -> nn.Module:
+        """
+        Return the shared instance for (kind, path, device, config), calling `loader()` on first use.
+        config: hashable loader settings that change the model built from `path` (e.g. VED.registry_config)
+        `loader()` runs outside the registry lock; concurrent callers for the same key wait for that one load.
+        Call release once done with the model so it can be freed.
+        """
+        key = self.key(kind, path, device, config)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refs += 1
+                    self.hits += 1
+                    self.saved_seconds += entry.load_seconds
+                    self.saved_bytes += entry.nbytes
+                    return entry.model
+                pending = self._loading.get(key)
+                if pending is None:
+                    pending = self._loading[key] = threading.Event()
+                    break
+            # another thread is loading this key, take its result (or retry if its loader failed)
+            pending.wait()
+        try:
+            start = time.time()
+            model = loader()
+            model.eval()
+            model.requires_grad_(False)
+            load_seconds = time.time() - start
+            # frozen TorchScript artifacts keep their weights as constants, fall back to the file size
+            nbytes = module_bytes(model) or os.path.getsize(path)
+            with self._lock:
+                self._entries[key] = _Entry(model, load_seconds, nbytes)
+                self._keys[id(model)] = key
+                self.loads += 1
+                self.load_seconds += load_seconds
+            return model
+        finally:
+            with self._lock:
+                del self._loading[key]
+            pending.set()
+
+    def release(self, model: nn.Module):
+        """Drop one reference, the registry forgets the model once nobody holds it."""
+        with self._lock:
+            key = self._keys.get(id(model))
+            if key is None:
+                return
+            entry = self._entries[key]
+            entry.refs -= 1
+            if entry.refs == 0:
+                del self._entries[key]
+                del self._keys[id(model)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'loads': self.loads,
+                'hits': self.hits,
+                'live_models': len(self._entries),
+                'live_refs': sum(entry.refs for entry in self._entries.values()),
+                'resident_bytes': sum(entry.nbytes for entry in self._entries.values()),
+                'load_seconds': self.load_seconds,
+                'saved_seconds': self.saved_seconds,
+                'saved_bytes': self.saved_bytes,
+            }
+
+
+REGISTRY = ModelRegistry()
@@ -0,0 +1,136 @@
+import torch
+import numpy as np
+from constants import ALPHABET
+from oracle_lib.utils.esm_tokens import ESM_TOKENS, MASK_IDX, PAD_IDX, encode_tokens, token_ids
+from plm_cache import CACHE, LogProbCache, model_key
+from plm_snapshot import load_plm
+from plm_profile import InferenceProfile
+import contextlib
+from typing import List, Optional, Sequence
+
+# masked: 位置ごとにマスクした forward (masked-marginal)
+# wt: マスクなしの forward 1回で全位置を読む (wild-type-marginal, 近似だが O(1) forward)
+MODES = ("masked", "wt")
+
+class MaskedLM:
+    """
+    PLMPolicy / PLMScorer 共通の ESM マスク言語モデル
+    """
+    def __init__(self, model_name: str = "facebook/esm2_t6_8M_UR50D", mode: str = "masked",
+                 cache: Optional[LogProbCache] = CACHE, profile: Optional[InferenceProfile] = None,
+                 window: Optional[int] = None) -> None:
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        if window is not None and window < 1:
+            raise ValueError(f"window must be positive, got {window}")
+        self.model_name = model_name
+        self.mode = mode
+        # cache=None でキャッシュを使わない
+        self.cache = cache
+        # profile: CPU 向け推論設定 (plm_profile.CPU など), None なら fp32 eager
+        self.profile = profile
+        # window: masked モードでマスク位置の前後 window 残基だけを入力する, None なら全長
+        # (attention は長さの2乗なので GFP のような長い配列の位置ごとの問い合わせが速くなる)
+        self.window = window
+        # 量子化や窓で出力が変わるのでキャッシュのキーは設定ごとに分ける
+        self.cache_name = model_key(model_name)
+        if profile is not None:
+            self.cache_name += f"@{profile.name}"
+        if window is not None:
+            self.cache_name += f"@window{window}"
+        # スナップショットから読み込み, 同じモデル名のインスタンス間で共有
+        self.tokenizer, self.model = load_plm(model_name, profile)
+        # トークナイザーは呼ばずに固定語彙のバイト表で直接トークンIDにする
+        if self.tokenizer.convert_tokens_to_ids(list(ESM_TOKENS)) != list(range(len(ESM_TOKENS))):
+            raise ValueError(f"{model_name} does not use the ESM-1b/ESM-2 vocabulary")
+        # ESMの語彙のうち20種の標準アミノ酸のトークンID (ALPHABET順)
+        self.aa_token_ids = token_ids(ALPHABET)
+
+    def _autocast(self):
+        if self.profile is None:
+            return contextlib.nullcontext()
+        # 同じプロセスの別プロファイルがスレッド数を変えていても forward ごとに自分の設定に戻す
+        self.profile.set_threads()
+        return self.profile.autocast()
+
+    def masked_logits(self, sequences: Sequence[str], positions: Sequence[int], batch_size: int = 64) -> torch.Tensor:
+        """
+        sequences[i] の positions[i] をマスクした forward をバッチで実行
+        window があれば前後 window 残基に切り出した短い配列をまとめて forward
+        output: (N, 20) ALPHABET順のロジット
+        """
+        if self.window is not None:
+            starts = [max(0, pos - self.window) for pos in positions]
+            sequences = [seq[s:pos + self.window + 1] for seq, s, pos in zip(sequences, starts, positions)]
+            positions = [pos - s for s, pos in zip(starts, positions)]
+        logits = []
+        for start in range(0, len(sequences), batch_size):
+            batch = list(sequences[start:start + batch_size])
+            input_ids = encode_tokens(batch)
+            rows = torch.arange(len(batch))
+            # 先頭に<cls>が付くため位置を+1補正
+            cols = torch.as_tensor(positions[start:start + batch_size]) + 1
+            attention_mask = input_ids.ne(PAD_IDX).long()
+            input_ids[rows, cols] = MASK_IDX
+            with torch.no_grad(), self._autocast():
+                out = self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+            logits.append(out[rows, cols][:, self.aa_token_ids].float())
+        return torch.cat(logits) if logits else torch.zeros(0, len(ALPHABET))
+
+    def masked_log_probs(self, sequences: Sequence[str], positions: Sequence[int], batch_size: int = 64) -> torch.Tensor:
+        """
+        masked_logits の20アミノ酸上の log_softmax, キャッシュにない (配列, 位置) だけ forward する
+        output: (N, 20)
+        """
+        if self.cache is None:
+            return torch.log_softmax(self.masked_logits(sequences, positions, batch_size), dim=-1)
+        keys = [self.cache.key(self.cache_name, seq, pos) for seq, pos in zip(sequences, positions)]
+        found = self.cache.get_many(keys)
+        todo = {}
+        for i, key in enumerate(keys):
+            if key not in found:
+                todo.setdefault(key, i)
+        if todo:
+            idx = list(todo.values())
+            computed = torch.log_softmax(self.masked_logits(
+                [sequences[i] for i in idx], [positions[i] for i in idx], batch_size
+            ), dim=-1).numpy()
+            self.cache.put_many(list(todo), computed)
+            found.update(zip(todo, computed))
+        if not keys:
+            return torch.zeros(0, len(ALPHABET))
+        return torch.from_numpy(np.stack([found[key] for key in keys]))
+
+    def wt_logits(self, sequences: Sequence[str], batch_size: int = 64) -> List[torch.Tensor]:
+        """
+        マスクなしの forward をバッチで実行
+        output: 各配列の (L, 20) ALPHABET順のロジット
+        """
+        logits = []
+        for start in range(0, len(sequences), batch_size):
+            batch = list(sequences[start:start + batch_size])
+            input_ids = encode_tokens(batch)
+            with torch.no_grad(), self._autocast():
+                out = self.model(input_ids=input_ids, attention_mask=input_ids.ne(PAD_IDX).long()).logits
+            out = out[:, :, self.aa_token_ids].float()
+            logits.extend(out[i, 1:len(seq) + 1] for i, seq in enumerate(batch))
+        return logits
+
+    def logits_at(self, sequences: Sequence[str], positions: Sequence[int], batch_size: int = 64,
+                  mode: Optional[str] = None) -> torch.Tensor:
+        """
+        mode (None なら self.mode) で sequences[i] の positions[i] のロジットを計算
+        masked モードはキャッシュ経由の対数確率 (ロジットと定数差なので softmax / argmax は同じ)
+        output: (N, 20)
+        """
+        mode = mode or self.mode
+        if mode == "masked":
+            return self.masked_log_probs(sequences, positions, batch_size)
+        if mode != "wt":
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        # 同じ配列はまとめて forward 1回
+        unique = {seq: i for i, seq in enumerate(dict.fromkeys(sequences))}
+        tables = self.wt_logits(list(unique), batch_size)
+        if not tables:
+            return torch.zeros(0, len(ALPHABET))
+        return torch.stack([tables[unique[seq]][pos] for seq, pos in zip(sequences, positions)])
@@ -0,0 +1,144 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# (モデル名, 配列ハッシュ, 位置) -> マスク位置の20アミノ酸の対数確率 (float32, ALPHABET順)
+# メモリ上の LRU と SQLite の2段構成. SQLite はプロセス間・再起動後も共有される
+# SQLite は opt-in: 環境変数 PLM_CACHE_PATH にファイルパスを指定したときだけ使う (未設定・空文字ならメモリのみ)
+# 相対パスは import 時の CWD で絶対パスに固定する
+DEFAULT_PATH = os.path.abspath(os.environ["PLM_CACHE_PATH"]) if os.environ.get("PLM_CACHE_PATH") else None
+
+Key = Tuple[str, bytes, int]
+
+def seq_hash(sequence: str) -> bytes:
+    return hashlib.blake2b(sequence.encode(), digest_size=16).digest()
+
+def model_key(model_name: str) -> str:
+    """
+    キャッシュのキーに使うモデル名
+    ローカルのチェックポイントはファイルのサイズと mtime を含め, 同じパスで再学習しても古い値を返さない
+    """
+    if not os.path.exists(model_name):
+        return model_name
+    if os.path.isfile(model_name):
+        paths = [model_name]
+    else:
+        paths = [os.path.join(root, name) for root, _, names in os.walk(model_name) for name in names]
+    digest = hashlib.blake2b(digest_size=8)
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.relpath(path, model_name)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return f"{model_name}#{digest.hexdigest()}"
+
+class LogProbCache:
+    def __init__(self, path: Optional[str] = DEFAULT_PATH, max_memory: int = 200_000,
+                 commit_every: int = 4096) -> None:
+        self.path = path
+        self.max_memory = max_memory
+        # commit_every 行ごとにまとめて commit, 残りは flush (終了時にも呼ばれる)
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        if path:
+            atexit.register(self.flush)
+        self._memory: "OrderedDict[Key, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_name: str, sequence: str, pos: int) -> Key:
+        return model_name, seq_hash(sequence), int(pos)
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        # fork 後の子プロセスは親の接続を使わず開き直す
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS logprobs ("
+                "model TEXT, seq_hash BLOB, pos INTEGER, value BLOB, PRIMARY KEY (model, seq_hash, pos))"
+            )
+            self._conn.commit()
+            self._pid = os.getpid()
+            self._uncommitted = 0
+        return self._conn
+
+    def _remember(self, key: Key, value: np.ndarray) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Sequence[Key]) -> Dict[Key, np.ndarray]:
+        """見つかったキーだけを返す"""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in dict.fromkeys(keys):
+                value = self._memory.get(key)
+                if value is None:
+                    missing.append(key)
+                else:
+                    self._memory.move_to_end(key)
+                    found[key] = value
+                    self.memory_hits += 1
+            db = self._db() if missing else None
+            for key in missing:
+                row = None if db is None else db.execute(
+                    "SELECT value FROM logprobs WHERE model=? AND seq_hash=? AND pos=?", key
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    continue
+                value = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, value)
+                found[key] = value
+                self.disk_hits += 1
+        return found
+
+    def put_many(self, keys: Sequence[Key], values: np.ndarray) -> None:
+        values = np.ascontiguousarray(values, dtype=np.float32)
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._remember(key, value.copy())
+            db = self._db()
+            if db is not None:
+                db.executemany(
+                    "INSERT OR IGNORE INTO logprobs VALUES (?, ?, ?, ?)",
+                    [(*key, value.tobytes()) for key, value in zip(keys, values)],
+                )
+                self._uncommitted += len(values)
+                if self._uncommitted >= self.commit_every:
+                    db.commit()
+                    self._uncommitted = 0
+
+    def flush(self) -> None:
+        """未 commit の書き込みを SQLite に反映する"""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid() and self._uncommitted:
+                self._conn.commit()
+                self._uncommitted = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+CACHE = LogProbCache()
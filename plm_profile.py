@@ -0,0 +1,56 @@
+import contextlib
+import os
+import warnings
+import torch
+import torch.nn as nn
+from typing import Optional
+
+class InferenceProfile:
+    """
+    CPU 向けの ESM 推論設定 (opt-in, 既定の PLMPolicy / PLMScorer は fp32 eager のまま)
+    quantize: Linear 層を動的 int8 量子化 (重みは int8, 活性は実行時に量子化)
+    bf16: bf16 autocast で forward (動的量子化 Linear は float32 入力のみなので quantize とは併用不可)
+    compile: torch.compile
+    num_threads: intra-op スレッド数, None なら利用可能なCPU数 (taskset / cgroup の制限を反映)
+    """
+    def __init__(self, quantize: bool = True, bf16: bool = False, compile: bool = False,
+                 num_threads: Optional[int] = None) -> None:
+        if quantize and bf16:
+            raise ValueError("dynamic int8 quantization expects float32 activations, cannot combine with bf16")
+        self.quantize = quantize
+        self.bf16 = bf16
+        self.compile = compile
+        self.num_threads = num_threads
+
+    @property
+    def name(self) -> str:
+        # 出力と重みを変える設定だけ (num_threads は set_threads で呼び出しごとに適用するので含めない)
+        parts = [p for p, on in (("int8", self.quantize), ("bf16", self.bf16), ("compile", self.compile)) if on]
+        return "+".join(parts) or "fp32"
+
+    def set_threads(self) -> None:
+        """torch のスレッド数はプロセス全体の設定なので, 別のプロファイルに変えられても forward ごとに設定し直す"""
+        num_threads = self.num_threads
+        if num_threads is None:
+            num_threads = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        torch.set_num_threads(max(1, num_threads))
+
+    def apply(self, model: nn.Module) -> nn.Module:
+        """共有の fp32 モデルは変更せず, 設定を適用したモデルを返す"""
+        self.set_threads()
+        if self.quantize:
+            with warnings.catch_warnings():
+                # torch.ao.quantization の非推奨警告
+                warnings.simplefilter("ignore")
+                model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=False)
+        if self.compile:
+            model = torch.compile(model)
+        return model
+
+    def autocast(self):
+        if self.bf16:
+            return torch.autocast("cpu", dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+# 既定の CPU プロファイル
+CPU = InferenceProfile()
@@ -0,0 +1,63 @@
+import os
+import re
+import sys
+import threading
+import time
+import torch
+import transformers
+from transformers import AutoTokenizer, EsmForMaskedLM
+from plm_profile import InferenceProfile
+from typing import Dict, Optional, Tuple
+
+# from_pretrained (hub のキャッシュ解決 + 重みの初期化 + コピー) を毎回走らせないためのスナップショット
+# 初回に tokenizer と eval モードのモジュールを丸ごと torch.save し, 以降は mmap で読む
+# 同じプロセス内では同じ (モデル名, 推論プロファイル) のインスタンスを共有する (読み取り専用, 学習には使わない)
+SNAPSHOT_DIR = os.environ.get("PLM_SNAPSHOT_DIR", os.path.join(".cache", "plm"))
+
+# キーは (モデル名, profile.name), profile なしの fp32 モデルは (モデル名, None)
+_SHARED: Dict[Tuple[str, Optional[str]], Tuple[object, torch.nn.Module]] = {}
+_LOCK = threading.Lock()
+
+def snapshot_path(model_name: str) -> str:
+    # pickle はライブラリのバージョンに依存するのでファイル名に含める
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name.strip("/"))
+    return os.path.join(SNAPSHOT_DIR, f"{name}-transformers{transformers.__version__}-torch{torch.__version__}.pt")
+
+def build_snapshot(model_name: str) -> str:
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = EsmForMaskedLM.from_pretrained(model_name)
+    model.eval()
+    model.requires_grad_(False)
+    path = snapshot_path(model_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save({"tokenizer": tokenizer, "model": model}, tmp)
+    os.replace(tmp, path)
+    return path
+
+def _load(model_name: str) -> Tuple[object, torch.nn.Module]:
+    path = snapshot_path(model_name)
+    if not os.path.exists(path):
+        build_snapshot(model_name)
+    # 自前で書いたファイルなので weights_only=False, 重みは mmap されページキャッシュ経由で共有される
+    snapshot = torch.load(path, mmap=True, weights_only=False)
+    return snapshot["tokenizer"], snapshot["model"]
+
+def load_plm(model_name: str, profile: Optional[InferenceProfile] = None) -> Tuple[object, torch.nn.Module]:
+    """プロセス内で共有される (tokenizer, model), profile があれば fp32 モデルに適用したもの"""
+    with _LOCK:
+        if (model_name, None) not in _SHARED:
+            _SHARED[model_name, None] = _load(model_name)
+        if profile is None:
+            return _SHARED[model_name, None]
+        profile.set_threads()
+        if (model_name, profile.name) not in _SHARED:
+            tokenizer, model = _SHARED[model_name, None]
+            _SHARED[model_name, profile.name] = tokenizer, profile.apply(model)
+        return _SHARED[model_name, profile.name]
+
+if __name__ == "__main__":
+    # usage: python plm_snapshot.py [model_name ...]
+    for model_name in sys.argv[1:] or ["facebook/esm2_t6_8M_UR50D"]:
+        start = time.perf_counter()
+        print(f"{model_name}: {build_snapshot(model_name)} ({time.perf_counter() - start:.1f}s)")
@@ -41,13 +41,14 @@ class PositionEnv(gym.Env):
         self.proxy = proxy
         self.proxy.setup() if proxy is not None else None # プロキシの初期化        
         
-    def _calc_reward(self, state):
+    def _calc_reward(self, state, parent=None):
         """
         報酬の仮関数: 
+        parent: 変異前の配列 (差分スコアリング用)
         """
         if self.proxy is None:
             return 0.0
-        return self.proxy(state)[0]
+        return self.proxy(state, parent=parent)[0]
 
     def reset(self, seed=None, options=None):
         """
@@ -78,11 +79,12 @@ class PositionEnv(gym.Env):
         # print(f"Current sequence: {obs}")
         # mut = self.model.predict(obs)
         # print(f"Predicted mutation: {mut}")
-        mut = AATOIDX[self.model.get_mut([idx_to_seq(self.sequence)], pos)]
+        parent = idx_to_seq(self.sequence)
+        mut = AATOIDX[self.model.get_mut([parent], pos)]
         self.sequence[pos] = mut
         self.steps += 1
         
-        reward = self._calc_reward([idx_to_seq(self.sequence)])
+        reward = self._calc_reward([idx_to_seq(self.sequence)], parent)
         done = (self.steps >= self.max_steps)
         truncated = False
 
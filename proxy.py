@@ -1,40 +1,147 @@
-from typing import List, Union
+from typing import Callable, List, Optional, Union
+from collections import OrderedDict
+import hashlib
+import os
 from oracle_lib.config import get_fitness_info
 from oracle_lib.baseline.insilico import Model 
+from oracle_lib.utils.oracle_client import OracleClient
 from torchtyping import TensorType
 import numpy as np
 import torch
 from constants import WT, idx_to_seq, seq_to_idx
 
 
+class FitnessCache:
+    """
+    Bounded LRU cache of fitness values keyed on a 16-byte blake2b hash of the sequence.
+    """
+    def __init__(self, max_size: int = 2**18):
+        self.max_size = max_size
+        self._store = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(sequence: str) -> bytes:
+        return hashlib.blake2b(sequence.encode('ascii'), digest_size=16).digest()
+
+    def __len__(self):
+        return len(self._store)
+
+    def get_or_score(self, sequences: List[str], score_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Look up every sequence, dedupe the misses within the batch and score them with a single `score_fn` call.
+        """
+        fitness = np.empty(len(sequences), dtype=np.float64)
+        missing = OrderedDict()  # key -> positions in `sequences`
+        for i, seq in enumerate(sequences):
+            k = self.key(seq)
+            if k in missing:
+                missing[k].append(i)
+                self.hits += 1
+                continue
+            value = self._store.get(k)
+            if value is None:
+                missing[k] = [i]
+                self.misses += 1
+            else:
+                self._store.move_to_end(k)
+                fitness[i] = value
+                self.hits += 1
+        if missing:
+            scores = np.asarray(score_fn([sequences[pos[0]] for pos in missing.values()]), dtype=np.float64)
+            for (k, pos), score in zip(missing.items(), scores):
+                fitness[pos] = score
+                self._put(k, float(score))
+        return fitness
+
+    def _put(self, key: bytes, value: float):
+        if self.max_size <= 0:
+            return
+        self._store[key] = value
+        self._store.move_to_end(key)
+        while len(self._store) > self.max_size:
+            self._store.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._store.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._store),
+            'hit_rate': self.hits / total if total > 0 else 0.0,
+        }
+
+
 class GFPScorer:
     """
     input: amino acid sequence (string)
     output: gfp cnn score (float)
+    cache_size: maximum number of cached fitness values (0 disables the cache)
+    oracle_path: training checkpoint or exported TorchScript artifact (*.ts), defaults to oracle_lib/ckpt/{protein}/oracle.ckpt
+    server: socket of a running oracle_lib/serve_oracle.py, scores remotely instead of loading the oracle
     """
-    def __init__(self):
+    def __init__(self, cache_size: int = 2**18, oracle_path: Optional[str] = None, server: Optional[str] = None):
         self.oracle = None
+        self.server = server
         self.protein = "GFP"
+        self.oracle_path = oracle_path
         self.device = "cuda"
         self.min_fitness = None
         self.max_fitness = None
         self.length = None
+        self.cache = FitnessCache(cache_size)
+        self._parent = None # sequence cached in the oracle's incremental scorer
     
     def setup(self):
-        self.oracle = Model(epochs=10, device=self.device)
-        oracle_ckpt = torch.load(f'oracle_lib/ckpt/{self.protein}/oracle.ckpt', map_location=self.device)
-        if "state_dict" in oracle_ckpt.keys():
-            oracle_ckpt = oracle_ckpt["state_dict"]
-        self.oracle.model.load_state_dict({ k.replace('predictor.',''):v for k,v in oracle_ckpt.items() }) 
+        oracle_path = self.oracle_path or f'oracle_lib/ckpt/{self.protein}/oracle.ckpt'
+        if self.server:
+            self.oracle = OracleClient(self.server, f'{self.protein}/{os.path.basename(oracle_path)}')
+        else:
+            self.oracle = Model(epochs=10, device=self.device)
+            self.oracle.load(oracle_path)
         self.length, self.min_fitness, self.max_fitness = get_fitness_info(self.protein)
+        self.cache.clear()
+        self._parent = None
     
     def normalize_fitness(self, fitness: List[float]) -> torch.Tensor:
         return (fitness - self.min_fitness)/(self.max_fitness - self.min_fitness)
+
+    def score(self, states: List[str], parent: Optional[str] = None) -> np.ndarray:
+        """
+        Uncached oracle call.
+        parent: sequence the states were mutated from, enables incremental scoring
+        """
+        if parent is None:
+            fitnesss = self.oracle.get_fitness(states)  
+        else:
+            if parent != self._parent:
+                self.oracle.set_parents([parent])
+            # a single child becomes the parent of the next step
+            update = len(states) == 1
+            fitnesss = self.oracle.get_child_fitness(states, update=update)
+            self._parent = states[0] if update else parent
+        return self.normalize_fitness(fitnesss)
         
+    def scan(self, sequence: str, chunk_size: int = 2048) -> np.ndarray:
+        """
+        input: amino acid sequence (string)
+        output: (L, 20) normalized fitness, entry [i, a] is `sequence` with ALPHABET[a] at position i
+        """
+        fitnesss = self.oracle.scan(sequence, chunk_size)
+        # the incremental scorer now caches `sequence`
+        self._parent = sequence
+        return self.normalize_fitness(fitnesss)
+
     def __call__(
-        self, states: List[str]) -> List[float]:
-        fitnesss = self.oracle.get_fitness(states)  
-        fitnesss = self.normalize_fitness(fitnesss)
+        self, states: List[str], parent: Optional[str] = None) -> List[float]:
+        fitnesss = self.cache.get_or_score(list(states), lambda seqs: self.score(seqs, parent))
         return fitnesss.tolist()
 
 if __name__ == "__main__":
@@ -42,4 +149,5 @@ if __name__ == "__main__":
     scorer.setup()
     gfp_seq = WT["GFP"]
     score = scorer([gfp_seq] * 3)
-    print(score)
\ No newline at end of file
+    print(score)
+    print(scorer.cache.stats())
@@ -1,119 +1,19 @@
 '''
 Reference: GGS (https://github.com/kirjner/GGS)
+oracle_lib/net/rew.py の再エクスポート (実装は oracle_lib 側だけに置く)
 '''
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-
-class MaskedConv1d(nn.Conv1d):
-    """ A masked 1-dimensional convolution layer.
-
-    Takes the same arguments as torch.nn.Conv1D, except that the padding is set automatically.
-
-         Shape:
-            Input: (N, L, in_channels)
-            input_mask: (N, L, 1), optional
-            Output: (N, L, out_channels)
-    """
-
-    def __init__(self, in_channels: int, out_channels: int,
-                 kernel_size: int, stride: int=1, dilation: int=1, groups: int=1,
-                 bias: bool=True):
-        """
-        :param in_channels: input channels
-        :param out_channels: output channels
-        :param kernel_size: the kernel width
-        :param stride: filter shift
-        :param dilation: dilation factor
-        :param groups: perform depth-wise convolutions
-        :param bias: adds learnable bias to output
-        """
-        padding = dilation * (kernel_size - 1) // 2
-        super().__init__(in_channels, out_channels, kernel_size, stride=stride, dilation=dilation,
-                                           groups=groups, bias=bias, padding=padding)
-
-    def forward(self, x, input_mask=None):
-        if input_mask is not None:
-            x = x * input_mask
-        return super().forward(x.transpose(1, 2)).transpose(1, 2)
-
-
-class LengthMaxPool1D(nn.Module):
-    def __init__(self, in_dim, out_dim, linear=False, activation='relu'):
-        super().__init__()
-        self.linear = linear
-        if self.linear:
-            self.layer = nn.Linear(in_dim, out_dim)
-
-        if activation == 'swish':
-            self.act_fn = lambda x: x * torch.sigmoid(100.0*x)
-        elif activation == 'softplus':
-            self.act_fn = nn.Softplus()
-        elif activation == 'sigmoid':
-            self.act_fn = nn.Sigmoid()
-        elif activation == 'leakyrelu':
-            self.act_fn = nn.LeakyReLU()
-        elif activation == 'relu':
-            self.act_fn = lambda x: F.relu(x)
-        else:
-            raise NotImplementedError
-
-    def forward(self, x):
-        if self.linear:
-            x = self.act_fn(self.layer(x))
-        x = torch.max(x, dim=1)[0]
-        return x
-
-
-class BaseCNN(nn.Module):
-    def __init__(
-            self,
-            n_tokens: int = 20,
-            kernel_size: int = 5 ,
-            input_size: int = 256,
-            dropout: float = 0.0,
-            make_one_hot=True,
-            activation: str = 'relu',
-            linear: bool=True,
-            **kwargs):
-        super(BaseCNN, self).__init__()
-        self.encoder = nn.Conv1d(n_tokens, input_size, kernel_size=kernel_size)
-        self.embedding = LengthMaxPool1D(
-            linear=linear,
-            in_dim=input_size,
-            out_dim=input_size*2,
-            activation=activation,
-        )
-        self.decoder = nn.Linear(input_size*2, 1)
-        self.n_tokens = n_tokens
-        self.dropout = nn.Dropout(dropout) # TODO: actually add this to model
-        self.input_size = input_size
-        self._make_one_hot = make_one_hot
-    
-    def get_embed(self, x):
-        #onehotize
-        if self._make_one_hot:
-            x = F.one_hot(x.long(), num_classes=self.n_tokens)
-        x = x.permute(0, 2, 1).float()
-        # encoder
-        x = self.encoder(x).permute(0, 2, 1)
-        x = self.dropout(x)
-        # embed
-        x = self.embedding(x)
-        return x
-
-    def forward(self, x, get_embed=False):
-        #onehotize
-        if self._make_one_hot:
-            x = F.one_hot(x.long(), num_classes=self.n_tokens)
-        x = x.permute(0, 2, 1).float()
-        # encoder
-        x = self.encoder(x).permute(0, 2, 1)
-        x = self.dropout(x)
-        # embed
-        x = self.embedding(x)
-        # decoder
-        output = self.decoder(x).squeeze(1)
-        if get_embed:
-            return x, output
-        return output
+from oracle_lib.net.rew import (
+    MaskedConv1d,
+    LengthMaxPool1D,
+    BaseCNN,
+    StackedCNN,
+    FusedCNN,
+    ExportedOracle,
+    load_oracle,
+    model_device,
+    single_mutants,
+    auto_batch_size,
+    predict_fitness,
+    scan_fitness,
+    IncrementalScorer,
+)
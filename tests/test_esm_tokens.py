@@ -0,0 +1,81 @@
+'''
+oracle_lib/utils/esm_tokens.py token-for-token against the fair-esm batch_converter and the HuggingFace EsmTokenizer.
+Batches are random variants of the wild-type sequences with varying lengths, so padding is exercised too.
+The tokenizer defaults to facebook/esm2_t6_8M_UR50D, set ESM_TOKENIZER to a local path to use another copy;
+the reference comparisons are skipped when esm or the tokenizer is unavailable.
+
+python -m pytest -q tests
+'''
+import os
+import random
+import pytest
+import torch
+from oracle_lib.utils.codec import seqs_to_idx
+from oracle_lib.utils.constants import WT, ALPHABET
+from oracle_lib.utils.esm_tokens import ESM_TOKENS, TOKEN_LUT, UNK_IDX, encode_tokens, mutation_mask, tokens_to_idx
+
+PROTEINS = ['GFP', 'AAV']
+
+
+def variants(wt, n=256, seed=0):
+    rng = random.Random(seed)
+    seqs = []
+    for _ in range(n):
+        seq = list(wt)
+        for pos in rng.sample(range(len(seq)), rng.randint(0, 10)):
+            seq[pos] = rng.choice(ALPHABET + ['X'])
+        seqs.append(''.join(seq))
+    return seqs
+
+
+def padded_batch(protein):
+    """Variants with every fourth one truncated, so the batch needs padding."""
+    rng = random.Random(1)
+    return [s[:rng.randint(1, len(s))] if i % 4 == 0 else s for i, s in enumerate(variants(WT[protein]))]
+
+
+def test_lut_maps_single_character_tokens_to_their_ids():
+    for idx, tok in enumerate(ESM_TOKENS):
+        if len(tok) == 1:
+            assert TOKEN_LUT[ord(tok)] == idx
+    assert TOKEN_LUT[ord('?')] == UNK_IDX
+
+
+@pytest.mark.parametrize('protein', PROTEINS)
+def test_mutation_mask(protein):
+    wt = WT[protein]
+    seqs = variants(wt)
+    expected = torch.tensor([[0] + [int(a != b) for a, b in zip(s, wt)] + [0] for s in seqs])
+    assert torch.equal(mutation_mask(seqs, wt), expected)
+
+
+@pytest.mark.parametrize('protein', PROTEINS)
+def test_tokens_to_idx_round_trip(protein):
+    seqs = [s for s in variants(WT[protein]) if 'X' not in s]
+    assert torch.equal(tokens_to_idx(encode_tokens(seqs)), torch.as_tensor(seqs_to_idx(seqs)))
+
+
+def test_tokens_to_idx_rejects_non_amino_acids():
+    with pytest.raises(ValueError):
+        tokens_to_idx(encode_tokens(['ACDX']))
+    with pytest.raises(ValueError):
+        tokens_to_idx(encode_tokens(['ACDE', 'AC'])) # padding
+
+
+@pytest.mark.parametrize('protein', PROTEINS)
+def test_matches_esm_batch_converter(protein):
+    esm = pytest.importorskip('esm')
+    batch_converter = esm.data.Alphabet.from_architecture('ESM-1b').get_batch_converter()
+    seqs = padded_batch(protein)
+    assert torch.equal(encode_tokens(seqs), batch_converter([('protein', s) for s in seqs])[2])
+
+
+@pytest.mark.parametrize('protein', PROTEINS)
+def test_matches_hf_tokenizer(protein):
+    transformers = pytest.importorskip('transformers')
+    try:
+        tokenizer = transformers.AutoTokenizer.from_pretrained(os.environ.get('ESM_TOKENIZER', 'facebook/esm2_t6_8M_UR50D'))
+    except OSError as e:
+        pytest.skip(f'tokenizer unavailable: {e}')
+    seqs = padded_batch(protein)
+    assert torch.equal(encode_tokens(seqs), tokenizer(seqs, return_tensors='pt', padding=True).input_ids)